@@ -162,6 +162,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 OAUTH2_PROVIDER = { 'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore' }
+
+# Số luồng xử lý file điểm danh chạy nền (participation/upload-csv?mode=background)
+IMPORT_JOB_WORKERS = 2
+
+# Thư mục lưu các file báo cáo điểm (CSV/PDF) đã sinh, dùng lại khi dữ liệu điểm chưa thay đổi
+EXPORT_CACHE_DIR = os.path.join(BASE_DIR, 'export_cache')
+
+# File điểm danh tải lên và file dòng lỗi của ImportJob: nằm ngoài MEDIA_ROOT để không bị phục vụ công khai
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 FIREBASE_CONFIG = {
@@ -1,16 +1,23 @@
-from django.contrib import admin
-from django.db.models import Count, Sum, Avg,Q
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count, Sum, Avg,Q, F
 from django.template.response import TemplateResponse
 from django.utils.safestring import mark_safe
 from scores.models import *
 from django import forms
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django.urls import path
-from django.http import HttpResponse
-import csv
-from io import BytesIO
-from reportlab.pdfgen import canvas
+from django.http import HttpResponseRedirect
 from reportlab.lib.pagesizes import A4
+from scores import exports, registrations, scoring
+from scores.scoring import recompute_all
+from scores.stats import class_stats
+
+ADMIN_SCORE_LABELS = ('Xuất Sắc', 'Giỏi', 'Khá', 'Trung Bình')
+
+
+def admin_score_rows():
+    return exports.score_rows('student_class__code', 'department__code', missing='', labels=ADMIN_SCORE_LABELS)
 
 class MyScoreAdmin(admin.AdminSite):
     site_header = 'Edu Scores'
@@ -19,172 +26,72 @@ class MyScoreAdmin(admin.AdminSite):
 
     def get_urls(self):
         return [
-            path('score-stats/', self.stats),
-            path('export-csv/', self.export_csv),
-            path('export-pdf/', self.export_pdf),
+            path('score-stats/', self.admin_view(self.stats)),
+            path('export-csv/', self.admin_view(self.export_csv)),
+            path('export-pdf/', self.admin_view(self.export_pdf)),
+            path('recompute-scores/', self.admin_view(self.recompute_scores)),
         ] + super().get_urls()
 
     def stats(self, request):
         all_classes = Class.objects.all()
 
         selected_class_id = request.GET.get('class')
-        if selected_class_id:
-            # Lấy thống kê điểm từ User theo lớp
-            stats_by_class = (
-                User.objects.filter(student_class__id=selected_class_id)
-                .values('student_class__name')
-                .annotate(
-                    total_score=Sum('total_score'),
-                    student_count=Count('id')
-                )
-            )
-
-            # Tính điểm trung bình
-            for stat in stats_by_class:
-                stat['avg_score'] = stat['total_score'] / stat['student_count'] if stat['student_count'] > 0 else 0
-
-            classification = (
-                User.objects.filter(student_class__id=selected_class_id)
-                .values('student_class__name')
-                .annotate(
-                    excellent=Count('total_score', filter=Q(total_score__gte=90)),
-                    good=Count('total_score', filter=Q(total_score__gte=75, total_score__lt=90)),
-                    average=Count('total_score', filter=Q(total_score__gte=50, total_score__lt=75)),
-                    poor=Count('total_score', filter=Q(total_score__lt=50)),
-                )
-            )
-        else:
-            # Lấy thống kê điểm từ User cho tất cả các lớp
-            stats_by_class = (
-                User.objects.values('student_class__name')
-                .annotate(
-                    total_score=Sum('total_score'),
-                    student_count=Count('id')
-                )
-            )
-
-            # Tính điểm trung bình
-            for stat in stats_by_class:
-                stat['avg_score'] = round(stat['total_score'] / stat['student_count'], 2) if stat['student_count'] > 0 else 0
-            classification = (
-                User.objects.values('student_class__name')
-                .annotate(
-                    excellent=Count('total_score', filter=Q(total_score__gte=90)),
-                    good=Count('total_score', filter=Q(total_score__gte=75, total_score__lt=90)),
-                    average=Count('total_score', filter=Q(total_score__gte=50, total_score__lt=75)),
-                    poor=Count('total_score', filter=Q(total_score__lt=50)),
-                )
-            )
+        if selected_class_id and not selected_class_id.isdigit():
+            selected_class_id = None
+        result = class_stats(selected_class_id)
 
         context = {
             'all_classes': all_classes,
             'selected_class_id': int(selected_class_id) if selected_class_id else None,
-            'stats_by_class': stats_by_class,
-            'classification': classification,
+            'stats_by_class': result['stats_by_class'],
+            'classification': result['classification'],
         }
 
         return TemplateResponse(request, 'admin/stats.html', context)
 
+    def recompute_scores(self, request):
+        if request.method == 'POST':
+            class_id = request.POST.get('class') or None
+            department_id = request.POST.get('department') or None
+            chunk_size = request.POST.get('chunk_size') or '1000'
+            if not chunk_size.isdigit() or any(value and not value.isdigit() for value in (class_id, department_id)):
+                messages.error(request, "Lớp, khoa hoặc số sinh viên mỗi lô không hợp lệ.")
+                return HttpResponseRedirect(request.path)
+            # Giới hạn như upload-csv: mỗi lô từ 1 tới 10000 sinh viên
+            chunk_size = min(max(int(chunk_size), 1), 10000)
+
+            result = recompute_all(class_id=class_id, department_id=department_id, chunk_size=chunk_size)
+
+            messages.success(request, (
+                f"Đã tính lại điểm cho {result['students']} sinh viên ({result['points']} điểm rèn luyện) "
+                f"trong {result['elapsed']:.2f}s - {result['students_per_second']:.0f} sinh viên/s."
+            ))
+            return HttpResponseRedirect(request.path)
+
+        context = {
+            **self.each_context(request),
+            'all_classes': Class.objects.all(),
+            'all_departments': Department.objects.all(),
+        }
+        return TemplateResponse(request, 'admin/recompute_scores.html', context)
+
     def export_csv(self, request):
-        # Xuất danh sách chi tiết dưới dạng CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="user_scores.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Student', 'Class', 'Department', 'Score', 'Classification'])
-
-        users = User.objects.select_related('student_class', 'department')
-        for user in users:
-            if user.total_score >= 90:
-                classification = 'Xuất Sắc'
-            elif user.total_score >= 75:
-                classification = 'Giỏi'
-            elif user.total_score >= 50:
-                classification = 'Khá'
-            else:
-                classification = 'Trung Bình'
-
-            writer.writerow([
-                user.username,
-                user.student_class.code if user.student_class else '',
-                user.department.code if user.department else '',
-                user.total_score,
-                classification,
-            ])
-
-        return response
+        # Xuất danh sách chi tiết dưới dạng CSV (?gzip=1 để nén), dùng lại file đã sinh nếu điểm chưa đổi
+        return exports.score_csv_artifact(
+            request, 'admin',
+            ['Student', 'Class', 'Department', 'Score', 'Classification'],
+            admin_score_rows
+        )
 
     def export_pdf(self, request):
-        # Xuất danh sách chi tiết dưới dạng PDF
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="user_scores.pdf"'
-
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=A4)
-
-        # Tiêu đề
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(200, 800, "User Scores Report")
-        p.setFont("Helvetica", 12)
-
-        # Kích thước và vị trí của bảng
-        table_top = 750
-        row_height = 20
-        col_widths = [100, 80, 80, 80, 100]  # Chiều rộng các cột
-        x_position = 50  # Vị trí bắt đầu vẽ bảng
-
-        # Kẻ tiêu đề của bảng
-        headers = ['Student', 'Class', 'Department', 'Score', 'Classification']
-        for col_idx, header in enumerate(headers):
-            p.drawString(x_position + sum(col_widths[:col_idx]), table_top, header)
-
-        # Kẻ đường kẻ dưới tiêu đề
-        p.line(x_position, table_top - 2, x_position + sum(col_widths), table_top - 2)
-
-        # Dữ liệu sinh viên
-        y = table_top - row_height
-        users = User.objects.select_related('student_class', 'department')
-
-        for user in users:
-            # Xác định xếp loại của sinh viên
-            if user.total_score >= 90:
-                classification = 'Xuất Sắc'
-            elif user.total_score >= 75:
-                classification = 'Giỏi'
-            elif user.total_score >= 50:
-                classification = 'Khá'
-            else:
-                classification = 'Trung Bình'
-
-            if y < 50:  # Tạo trang mới nếu hết chỗ
-                p.showPage()
-                y = 750
-                # Vẽ lại tiêu đề và các đường kẻ
-                for col_idx, header in enumerate(headers):
-                    p.drawString(x_position + sum(col_widths[:col_idx]), y, header)
-                p.line(x_position, y - 2, x_position + sum(col_widths), y - 2)
-                y -= row_height
-
-            # Vẽ các giá trị vào bảng
-            p.drawString(x_position, y, user.username)
-            p.drawString(x_position + col_widths[0], y, user.student_class.code if user.student_class else '')
-            p.drawString(x_position + col_widths[0] + col_widths[1], y, user.department.code if user.department else '')
-            p.drawString(x_position + col_widths[0] + col_widths[1] + col_widths[2], y, str(user.total_score))
-            p.drawString(x_position + col_widths[0] + col_widths[1] + col_widths[2] + col_widths[3], y, classification)
-
-            # Kẻ đường kẻ cho mỗi hàng
-            p.line(x_position, y - 2, x_position + sum(col_widths), y - 2)
-
-            y -= row_height
-
-        # Kẻ đường kẻ dưới cùng bảng
-        p.line(x_position, y - 2, x_position + sum(col_widths), y - 2)
-
-        p.save()
-        buffer.seek(0)
-        response.write(buffer.getvalue())
-        buffer.close()
-        return response
+        # Xuất danh sách chi tiết dưới dạng PDF, dùng lại file đã sinh nếu điểm chưa đổi
+        report = exports.ScorePDFReport(
+            "User Scores Report",
+            ['Student', 'Class', 'Department', 'Score', 'Classification'],
+            [100, 80, 80, 80, 100],
+            pagesize=A4
+        )
+        return exports.score_pdf_artifact(request, 'admin', report, admin_score_rows)
 
 class BaseAdmin(admin.ModelAdmin):
     class Media:
@@ -197,6 +104,8 @@ class UserAdmin(admin.ModelAdmin):
     search_fields = ('username', 'email')
     list_filter = ('is_staff', 'is_superuser')
     ordering = ('username',)
+    # Điểm chỉ được tính từ DisciplinePoint, không sửa tay
+    readonly_fields = ('total_score',)
 
     def save_model(self, request, obj, form, change):
         if 'password' in form.changed_data:
@@ -253,6 +162,27 @@ class DisciplinePointAdmin(BaseAdmin):
     def save_model(self, request, obj, form, change):
         obj.save()
 
+    def delete_queryset(self, request, queryset):
+        # Xoá nhiều điểm một lúc: tính lại mỗi sinh viên một lần thay vì trừ điểm theo từng dòng
+        with scoring.deferred_recompute():
+            super().delete_queryset(request, queryset)
+
+class StudentGroupScoreAdmin(admin.ModelAdmin):
+    list_display = ('student', 'group', 'raw_score', 'capped_score', 'updated_date')
+    list_filter = ('group',)
+    search_fields = ('student__username',)
+    readonly_fields = ('raw_score', 'capped_score')
+
+class ScoreRollupAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'student_count', 'score_sum', 'excellent', 'good', 'average', 'poor', 'updated_date')
+    readonly_fields = ('student_count', 'score_sum', 'score_sum_squares', 'excellent', 'good', 'average', 'poor')
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'created_by', 'processed_rows', 'failed_rows', 'rows_per_second', 'created_date')
+    list_filter = ('status', 'partial')
+    readonly_fields = ('status', 'checkpoint', 'processed_rows', 'unchanged_rows', 'failed_rows', 'rows_per_second',
+                       'errors', 'failure_reason', 'error_file', 'started_at', 'finished_at')
+
 class ReportAdmin(BaseAdmin):
     list_display = ('student', 'activity', 'status', 'handled_by')
     list_filter = ('status', 'activity', 'student')
@@ -273,6 +203,32 @@ class RegistrationAdmin(admin.ModelAdmin):
     search_fields = ('student__username', 'activity__title')
     list_filter = ('activity', 'timestamp')
 
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        # Hoạt động đang giữ chỗ trước khi lưu (None nếu mới thêm hoặc đăng ký không active), đọc dưới khoá dòng
+        held = None
+        if change:
+            previous = Registration.objects.select_for_update().filter(pk=obj.pk).values('activity_id', 'active').first()
+            if previous and previous['active']:
+                held = previous['activity_id']
+        super().save_model(request, obj, form, change)
+
+        holds = obj.activity_id if obj.active else None
+        if held == holds:
+            return
+        if held is not None:
+            # Đổi hoạt động hoặc tắt active: trả chỗ cũ và xếp người đầu hàng chờ như khi xoá đăng ký
+            registrations.release_seats(held)
+            transaction.on_commit(lambda: registrations.promote(held))
+        if holds is not None:
+            # Admin được thêm vượt sức chứa, nhưng registered_count vẫn phải khớp số đăng ký
+            Activity.objects.filter(pk=holds).update(registered_count=F('registered_count') + 1)
+
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'activity', 'created_date')
+    search_fields = ('student__username', 'activity__title')
+    list_filter = ('activity',)
+
 class LikeAdmin(BaseAdmin):
     list_display = ('user', 'newsfeed')
 
@@ -296,9 +252,14 @@ admin_site.register(Participation, ParticipationAdmin)
 admin_site.register(EvaluationCriteria, EvaluationCriteriaAdmin)
 admin_site.register(EvaluationGroup, EvaluationGroupAdmin)
 admin_site.register(DisciplinePoint, DisciplinePointAdmin)
+admin_site.register(StudentGroupScore, StudentGroupScoreAdmin)
+admin_site.register(ClassScoreRollup, ScoreRollupAdmin)
+admin_site.register(DepartmentScoreRollup, ScoreRollupAdmin)
 admin_site.register(Report, ReportAdmin)
+admin_site.register(ImportJob, ImportJobAdmin)
 admin_site.register(NewsFeed, NewsFeedAdmin)
 admin_site.register(Registration, RegistrationAdmin)
+admin_site.register(WaitlistEntry, WaitlistEntryAdmin)
 admin_site.register(Like, LikeAdmin)
 admin_site.register(Comment, CommentAdmin)
 admin_site.register(Message, MessageAdmin)
@@ -0,0 +1,495 @@
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet là tuỳ chọn, chỉ bật khi đã cài pyarrow
+    pyarrow = None
+
+from . import versions
+from .models import DisciplinePoint, Registration, User
+
+SCORE_LABELS = ('Excellent', 'Good', 'Average', 'Poor')
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def classify(score, labels=SCORE_LABELS):
+    if score >= 90:
+        return labels[0]
+    if score >= 75:
+        return labels[1]
+    if score >= 50:
+        return labels[2]
+    return labels[3]
+
+
+def score_rows(class_field='student_class__name', department_field='department__name', missing='N/A',
+               labels=SCORE_LABELS, chunk_size=EXPORT_CHUNK_SIZE):
+    """Các dòng (sinh viên, lớp, khoa, điểm, xếp loại) đọc theo lô bằng values_list, không tạo model instance."""
+    users = User.objects.order_by('id').values_list('username', class_field, department_field, 'total_score')
+    for username, class_value, department_value, total_score in users.iterator(chunk_size=chunk_size):
+        yield [
+            username,
+            class_value if class_value is not None else missing,
+            department_value if department_value is not None else missing,
+            total_score,
+            classify(total_score, labels),
+        ]
+
+
+def iter_csv(header, rows, compress=False, rows_per_chunk=500, bom=False):
+    """Sinh nội dung CSV theo từng khối; compress=True thì nén gzip ngay trong lúc stream."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if bom:
+        # BOM để Excel nhận đúng UTF-8
+        buffer.write('\ufeff')
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % rows_per_chunk == 0:
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if chunk:
+        yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def csv_response(filename, header, rows, compress=False, bom=False):
+    if compress:
+        response = StreamingHttpResponse(iter_csv(header, rows, compress=True, bom=bom),
+                                         content_type='application/gzip')
+        filename = f'{filename}.gz'
+    else:
+        response = StreamingHttpResponse(iter_csv(header, rows, bom=bom), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def wants_gzip(request):
+    return request.GET.get('gzip') in ('1', 'true')
+
+
+DEFAULT_TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+]
+
+
+class ScorePDFReport:
+    """Bảng điểm PDF nhiều trang: mỗi trang vẽ một bảng riêng với dòng tiêu đề lặp lại.
+
+    Các dòng được lấy dần từ iterator và mỗi lần chỉ dựng Table cho một trang, nhưng canvas của reportlab giữ
+    nội dung mọi trang đã vẽ cho tới save() nên bộ nhớ vẫn tăng tuyến tính theo số trang (khoảng 24 MiB với
+    50k sinh viên). Vì vậy PDF được sinh một lần rồi lưu vào cache (xem score_pdf_artifact).
+    """
+
+    margin = 50
+    title_height = 40
+    header_height = 22
+    row_height = 16
+
+    def __init__(self, title, header, col_widths, pagesize=letter, table_style=None):
+        self.title = title
+        self.header = header
+        self.col_widths = col_widths
+        self.pagesize = pagesize
+        self.table_style = TableStyle(table_style or DEFAULT_TABLE_STYLE)
+        self.pages = 0
+        self.rows = 0
+
+    def rows_per_page(self, first_page):
+        height = self.pagesize[1] - 2 * self.margin - self.header_height
+        if first_page:
+            height -= self.title_height
+        return max(int(height // self.row_height), 1)
+
+    def draw_page(self, pdf_canvas, rows):
+        width, height = self.pagesize
+        top = height - self.margin
+
+        if self.pages == 0:
+            pdf_canvas.setFont("Helvetica-Bold", 16)
+            pdf_canvas.drawCentredString(width / 2, top - 16, self.title)
+            top -= self.title_height
+
+        table = Table([self.header] + rows, colWidths=self.col_widths,
+                      rowHeights=[self.header_height] + [self.row_height] * len(rows))
+        table.setStyle(self.table_style)
+        table_width, table_height = table.wrapOn(pdf_canvas, width, height)
+        table.drawOn(pdf_canvas, (width - table_width) / 2, top - table_height)
+
+        self.pages += 1
+        pdf_canvas.setFont("Helvetica", 8)
+        pdf_canvas.drawRightString(width - self.margin, self.margin / 2, f"{self.pages}")
+        pdf_canvas.showPage()
+
+    def write(self, output, rows):
+        """Ghi PDF thẳng vào output (HttpResponse hoặc file)."""
+        pdf_canvas = canvas.Canvas(output, pagesize=self.pagesize)
+        page = []
+        for row in rows:
+            page.append([str(value) for value in row])
+            if len(page) >= self.rows_per_page(self.pages == 0):
+                self.rows += len(page)
+                self.draw_page(pdf_canvas, page)
+                page = []
+
+        if page or self.pages == 0:
+            self.rows += len(page)
+            self.draw_page(pdf_canvas, page)
+
+        pdf_canvas.save()
+        return output
+
+
+def _artifact_dir():
+    path = getattr(settings, 'EXPORT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'export_cache'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _artifact_tmp_path(path):
+    # Ghi ra file tạm rồi đổi tên để request khác không đọc phải file đang ghi dở
+    return f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+
+
+def _remove_older_artifacts(path, variant, version):
+    # Xoá các bản cũ hơn của đúng loại báo cáo này (không đụng tới {variant}-gz-...); worker khác có thể còn đọc
+    # version cũ trong cache vài giây, nên không xoá bản có version mới hơn
+    pattern = re.compile(rf'{re.escape(variant)}-(\d+)-\d+')
+    for name in os.listdir(os.path.dirname(path)):
+        match = pattern.fullmatch(name)
+        if match and int(match.group(1)) < version:
+            try:
+                os.remove(os.path.join(os.path.dirname(path), name))
+            except OSError:
+                pass
+
+
+def _build_artifact(path, variant, version, write):
+    """Sinh file báo cáo tại path và trả về file đó đã mở để đọc."""
+    tmp_path = _artifact_tmp_path(path)
+    try:
+        with open(tmp_path, 'wb') as file:
+            write(file)
+        # Mở trước khi đổi tên: file đã mở vẫn đọc được dù sau đó bị worker khác xoá
+        result = open(tmp_path, 'rb')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    _remove_older_artifacts(path, variant, version)
+    return result
+
+
+def _tee_artifact(path, variant, version, chunks):
+    """Trả từng khối cho client đồng thời ghi vào file tạm; chỉ đưa vào cache khi đã stream hết."""
+    tmp_path = _artifact_tmp_path(path)
+    try:
+        with open(tmp_path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+    finally:
+        # Client ngắt giữa chừng hoặc lỗi khi sinh dữ liệu: bỏ file dở, lần sau sinh lại
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    _remove_older_artifacts(path, variant, version)
+
+
+def artifact_response(request, variant, filename, content_type, write=None, chunks=None):
+    """Phục vụ file báo cáo đã sinh sẵn theo version dữ liệu điểm; trả 304 nếu client đã có bản mới nhất.
+
+    Định dạng sinh được theo từng khối truyền chunks (hàm trả về iterator bytes): lần đầu vừa stream vừa ghi
+    vào cache. Định dạng chỉ ghi được cả file một lần (PDF) truyền write(file).
+    """
+    version, modified = versions.get_version(versions.SCORES)
+    stamp = f'{version}-{int(modified.timestamp())}'
+    etag = f'"{variant}-{stamp}"'
+    last_modified = int(modified.timestamp())
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        not_modified['Last-Modified'] = http_date(last_modified)
+        return not_modified
+
+    path = os.path.join(_artifact_dir(), f'{variant}-{stamp}')
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        # Chưa có, hoặc vừa bị worker khác dọn đi: sinh lại
+        file = None
+    if file is not None:
+        response = FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+    elif chunks is not None:
+        response = StreamingHttpResponse(_tee_artifact(path, variant, version, chunks()), content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        response = FileResponse(_build_artifact(path, variant, version, write), as_attachment=True,
+                                filename=filename, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def score_csv_artifact(request, variant, header, rows_factory):
+    if wants_gzip(request):
+        return artifact_response(request, f'{variant}-csv-gz', 'user_scores.csv.gz', 'application/gzip',
+                                 chunks=lambda: iter_csv(header, rows_factory(), compress=True))
+    return artifact_response(request, f'{variant}-csv', 'user_scores.csv', 'text/csv',
+                             chunks=lambda: iter_csv(header, rows_factory()))
+
+
+def score_pdf_artifact(request, variant, report, rows_factory):
+    return artifact_response(request, f'{variant}-pdf', 'user_scores.pdf', 'application/pdf',
+                             write=lambda file: report.write(file, rows_factory()))
+
+
+MAX_ZIP_ACTIVITIES = 200
+REGISTRATION_HEADER = ['Student ID', 'Student Name', 'Activity ID', 'Activity Title', 'Attendance', 'Score']
+
+
+def registration_rows(activity_ids, chunk_size=EXPORT_CHUNK_SIZE):
+    """Đăng ký của các hoạt động, sắp theo hoạt động, lấy kèm thông tin sinh viên bằng JOIN."""
+    registrations = Registration.objects.filter(activity_id__in=activity_ids).order_by('activity_id', 'id') \
+        .values_list('activity_id', 'student_id', 'student__first_name', 'student__last_name')
+    return registrations.iterator(chunk_size=chunk_size)
+
+
+def registration_csv_row(activity_id, activity_title, student_id, first_name, last_name):
+    return [student_id, f"{first_name} {last_name}", activity_id, activity_title, '', '']
+
+
+class _ZipStream:
+    """Đích ghi không seek được cho zipfile; dữ liệu đã ghi được lấy ra dần để stream."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def iter_registration_zip(activities, rows_per_chunk=500):
+    """ZIP gồm một file CSV cho mỗi hoạt động, duyệt danh sách đăng ký một lần (đã sắp theo hoạt động)."""
+    stream = _ZipStream()
+    titles = dict(activities)
+    rows = registration_rows(list(titles))
+    pending = next(rows, None)
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for activity_id in sorted(titles):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write('\ufeff')
+            writer.writerow(REGISTRATION_HEADER)
+
+            with archive.open(f'registrations_{activity_id}.csv', 'w') as entry:
+                count = 0
+                while pending is not None and pending[0] == activity_id:
+                    writer.writerow(registration_csv_row(activity_id, titles[activity_id], *pending[1:]))
+                    pending = next(rows, None)
+                    count += 1
+                    if count % rows_per_chunk == 0:
+                        entry.write(buffer.getvalue().encode('utf-8'))
+                        buffer.seek(0)
+                        buffer.truncate(0)
+                        data = stream.pop()
+                        if data:
+                            yield data
+                entry.write(buffer.getvalue().encode('utf-8'))
+
+            data = stream.pop()
+            if data:
+                yield data
+
+    yield stream.pop()
+
+
+def registration_zip_response(filename, activities):
+    response = StreamingHttpResponse(iter_registration_zip(activities), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+DISCIPLINE_FIELDS = (
+    ('id', 'id'),
+    ('student_id', 'student_id'),
+    ('student', 'student__username'),
+    ('student_class', 'student__student_class__name'),
+    ('activity_id', 'activity_id'),
+    ('activity', 'activity__title'),
+    ('criteria_id', 'criteria_id'),
+    ('criteria', 'criteria__name'),
+    ('group_id', 'criteria__group_id'),
+    ('group', 'criteria__group__name'),
+    ('score', 'score'),
+    ('active', 'active'),
+    ('created_date', 'created_date'),
+    ('updated_date', 'updated_date'),
+)
+DISCIPLINE_COLUMNS = [name for name, _ in DISCIPLINE_FIELDS]
+
+
+# Mốc watermark lùi lại so với hiện tại: updated_date được gán trước khi transaction commit, một transaction
+# commit muộn có thể có updated_date nhỏ hơn mốc đã trả về. Với độ trễ này, mọi transaction ghi điểm
+# ngắn hơn DISCIPLINE_WATERMARK_LAG đều nằm trong lần lấy sau
+DISCIPLINE_WATERMARK_LAG = datetime.timedelta(minutes=5)
+
+
+def discipline_watermark(updated_since=None):
+    """Mốc trên của lần xuất: updated_date lớn nhất nhưng không quá now - DISCIPLINE_WATERMARK_LAG."""
+    latest = DisciplinePoint.objects.aggregate(latest=Max('updated_date'))['latest']
+    if latest is not None:
+        latest = min(latest, timezone.now() - DISCIPLINE_WATERMARK_LAG)
+    if updated_since is not None and (latest is None or latest < updated_since):
+        return updated_since
+    return latest
+
+
+def discipline_point_chunks(updated_since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Các dòng phẳng của DisciplinePoint theo từng khối, phân trang bằng khoá (không dùng OFFSET).
+
+    Xuất toàn bộ: khoá id. Có updated_since/until: lấy các dòng có updated_date trong (updated_since, until],
+    khoá (updated_date, id) theo chỉ mục discipline_updated_idx.
+    """
+    fields = [field for _, field in DISCIPLINE_FIELDS]
+    if updated_since is None and until is None:
+        query = DisciplinePoint.objects.order_by('id').values_list(*fields)
+        last_id = 0
+        while True:
+            chunk = list(query.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1][0]
+
+    query = DisciplinePoint.objects.order_by('updated_date', 'id')
+    if until is not None:
+        query = query.filter(updated_date__lte=until)
+    query = query.values_list(*fields)
+    updated_index = fields.index('updated_date')
+
+    after = query.filter(updated_date__gt=updated_since) if updated_since is not None else query
+    while True:
+        chunk = list(after[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_updated, last_id = chunk[-1][updated_index], chunk[-1][0]
+        after = query.filter(Q(updated_date__gt=last_updated) | Q(updated_date=last_updated, id__gt=last_id))
+
+
+def _json_default(value):
+    # Giữ đủ micro giây để updated_date dùng được làm watermark
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def iter_ndjson(columns, chunks, compress=True):
+    """Mỗi dòng một object JSON, nén gzip theo từng khối."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default)
+
+    for chunk in chunks:
+        data = ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk).encode('utf-8')
+        data = compressor.compress(data) if compressor else data
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def ndjson_response(filename, columns, chunks, compress=True):
+    if compress:
+        response = StreamingHttpResponse(iter_ndjson(columns, chunks), content_type='application/gzip')
+        filename = f'{filename}.gz'
+    else:
+        response = StreamingHttpResponse(iter_ndjson(columns, chunks, compress=False),
+                                         content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def discipline_parquet_schema():
+    timestamp = pyarrow.timestamp('us', tz='UTC')
+    types = {
+        'student': pyarrow.string(), 'student_class': pyarrow.string(), 'activity': pyarrow.string(),
+        'criteria': pyarrow.string(), 'group': pyarrow.string(), 'score': pyarrow.float64(),
+        'active': pyarrow.bool_(), 'created_date': timestamp, 'updated_date': timestamp,
+    }
+    return pyarrow.schema([(name, types.get(name, pyarrow.int64())) for name in DISCIPLINE_COLUMNS])
+
+
+def write_parquet(output, schema, chunks):
+    """Ghi Parquet, mỗi khối dữ liệu là một row group."""
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+
+
+def parquet_response(filename, schema, chunks):
+    # Parquet ghi phần footer sau cùng nên không stream trực tiếp được; ghi ra file tạm rồi trả về
+    output = tempfile.TemporaryFile()
+    write_parquet(output, schema, chunks)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type='application/vnd.apache.parquet')
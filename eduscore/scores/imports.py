@@ -0,0 +1,264 @@
+import csv
+import gzip
+import io
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import scoring
+from .models import Activity, DisciplinePoint, EvaluationCriteria, Participation, Registration, User
+
+
+class RowError(ValueError):
+    pass
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_csv(file):
+    """Đọc CSV (có thể nén gzip) theo luồng, không nạp toàn bộ file vào bộ nhớ."""
+    stream = file
+    if file.read(2) == GZIP_MAGIC:
+        file.seek(0)
+        stream = gzip.GzipFile(fileobj=file, mode='rb')
+    else:
+        file.seek(0)
+    return csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+
+def parse_row(row):
+    student_id_str = (row.get('Student ID') or '').strip().replace('\ufeff', '').strip()
+    if not student_id_str.isdigit():
+        raise RowError(f"Invalid Student ID: {student_id_str}")
+
+    activity_id_str = (row.get('Activity ID') or '').strip()
+    if not activity_id_str.isdigit():
+        raise RowError(f"Invalid Activity ID: {activity_id_str}")
+
+    try:
+        score = float(row.get('Score', 0))
+    except (TypeError, ValueError):
+        raise RowError(f"Invalid Score: {row.get('Score')}")
+
+    # Attendance khác rỗng thì xem như đã hoàn thành
+    is_completed = bool((row.get('Attendance') or '').strip())
+
+    return int(student_id_str), int(activity_id_str), is_completed, score
+
+
+class AttendanceImporter:
+    """Nhập file điểm danh: tra cứu trước bằng truy vấn IN, ghi bằng bulk_create/bulk_update trong một transaction."""
+
+    batch_size = 500
+
+    def __init__(self, on_progress=None, partial=False, start_after=0):
+        """partial=True: ghi các dòng hợp lệ và ghi nhận dòng lỗi thay vì dừng lại.
+        start_after: số dòng (checkpoint) đã xử lý ở lần chạy trước, các dòng đó được bỏ qua."""
+        self.on_progress = on_progress
+        self.partial = partial
+        self.start_after = start_after
+        self.checkpoint = start_after
+        self.processed = 0
+        self.unchanged = 0
+        self.errors = []
+        self.elapsed = 0
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0
+
+    def summary(self):
+        return {
+            'rows': self.processed,
+            'unchanged': self.unchanged,
+            'failed': len(self.errors),
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+    def add_error(self, line_no, row, message):
+        self.errors.append({'row': line_no, 'data': row, 'error': message})
+
+    def run(self, rows, chunk_size=None):
+        """Nhập các dòng; có chunk_size thì mỗi lô chunk_size dòng là một transaction riêng."""
+        started = time.perf_counter()
+        try:
+            for chunk in self.chunks(rows, chunk_size, self.start_after):
+                batch = []
+                for line_no, row in chunk:
+                    try:
+                        batch.append((line_no, row, parse_row(row)))
+                    except RowError as e:
+                        self.add_error(line_no, row, str(e))
+
+                if self.errors and not self.partial:
+                    break
+                self.import_batch(batch)
+                if self.errors and not self.partial:
+                    break
+
+                self.checkpoint = chunk[-1][0]
+
+                if self.on_progress:
+                    self.elapsed = time.perf_counter() - started
+                    self.on_progress(self)
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+        return not self.errors
+
+    @staticmethod
+    def chunks(rows, chunk_size=None, start_after=0):
+        chunk = []
+        for line_no, row in enumerate(rows, start=2):
+            if line_no <= start_after:
+                continue
+            chunk.append((line_no, row))
+            if chunk_size and len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def import_batch(self, batch):
+        if not batch:
+            return
+
+        student_ids = {parsed[0] for _, _, parsed in batch}
+        activity_ids = {parsed[1] for _, _, parsed in batch}
+
+        with transaction.atomic():
+            students = set(User.objects.filter(id__in=student_ids).values_list('id', flat=True))
+            activities = set(Activity.objects.filter(id__in=activity_ids).values_list('id', flat=True))
+
+            criteria = {}
+            for activity_id, criteria_id in EvaluationCriteria.objects.filter(
+                    activity_id__in=activity_ids).order_by('-created_date').values_list('activity_id', 'id'):
+                criteria.setdefault(activity_id, criteria_id)
+
+            registered = set(Registration.objects.filter(
+                student_id__in=student_ids, activity_id__in=activity_ids
+            ).values_list('student_id', 'activity_id'))
+
+            rows = {}
+            valid = 0
+            for line_no, row, (student_id, activity_id, is_completed, score) in batch:
+                if student_id not in students:
+                    self.add_error(line_no, row, f"Student {student_id} does not exist")
+                elif activity_id not in activities:
+                    self.add_error(line_no, row, f"Activity {activity_id} does not exist")
+                elif activity_id not in criteria:
+                    self.add_error(line_no, row, f"No valid criteria found for activity {activity_id}")
+                elif (student_id, activity_id) not in registered:
+                    self.add_error(line_no, row, f"Student {student_id} is not registered for activity {activity_id}")
+                else:
+                    # Dòng trùng (sinh viên, hoạt động): dòng sau ghi đè dòng trước
+                    rows[(student_id, activity_id)] = (is_completed, score)
+                    valid += 1
+
+            if self.errors and not self.partial:
+                return
+
+            changed_students = self.write(rows, criteria, student_ids, activity_ids)
+            if changed_students:
+                scoring.recompute_scores(sorted(changed_students))
+
+        self.processed += valid
+
+    def write(self, rows, criteria, student_ids, activity_ids):
+        now = timezone.now()
+
+        participations = {
+            (p.student_id, p.activity_id): p
+            for p in Participation.objects.filter(student_id__in=student_ids, activity_id__in=activity_ids)
+            .only('id', 'student_id', 'activity_id', 'is_completed')
+        }
+
+        points = {}
+        for point in DisciplinePoint.objects.filter(student_id__in=student_ids, activity_id__in=activity_ids) \
+                .only('id', 'student_id', 'activity_id', 'criteria_id', 'score').order_by('-created_date'):
+            points.setdefault((point.student_id, point.activity_id), point)
+
+        new_participations, changed_participations = [], []
+        new_points, changed_points = [], []
+        changed_students = set()
+
+        for key, (is_completed, score) in rows.items():
+            student_id, activity_id = key
+            changed = False
+
+            participation = participations.get(key)
+            if participation is None:
+                new_participations.append(Participation(
+                    student_id=student_id, activity_id=activity_id, is_completed=is_completed
+                ))
+                changed = True
+            elif participation.is_completed != is_completed:
+                participation.is_completed = is_completed
+                participation.updated_date = now
+                changed_participations.append(participation)
+                changed = True
+
+            point = points.get(key)
+            if point is None:
+                new_points.append(DisciplinePoint(
+                    student_id=student_id, activity_id=activity_id,
+                    criteria_id=criteria[activity_id], score=score
+                ))
+                changed_students.add(student_id)
+                changed = True
+            elif point.score != score or point.criteria_id != criteria[activity_id]:
+                point.score = score
+                point.criteria_id = criteria[activity_id]
+                point.updated_date = now
+                changed_points.append(point)
+                changed_students.add(student_id)
+                changed = True
+
+            # Dòng không đổi so với dữ liệu hiện có thì không ghi và không tính lại điểm
+            if not changed:
+                self.unchanged += 1
+
+        Participation.objects.bulk_create(new_participations, batch_size=self.batch_size)
+        Participation.objects.bulk_update(changed_participations, ['is_completed', 'updated_date'],
+                                          batch_size=self.batch_size)
+
+        # group_total_score và total_score được tính lại theo lô sau khi ghi
+        DisciplinePoint.objects.bulk_create(new_points, batch_size=self.batch_size)
+        DisciplinePoint.objects.bulk_update(changed_points, ['score', 'criteria', 'updated_date'],
+                                            batch_size=self.batch_size)
+
+        return changed_students
+
+
+def error_rows_csv(errors):
+    """CSV gồm số dòng gốc (Row), các cột gốc của dòng lỗi và cột Error, để sửa rồi tải lên lại.
+
+    Khi tải lên lại, cột Row và Error bị bỏ qua.
+    """
+    fieldnames = ['Row']
+    for error in errors:
+        for name in (error.get('data') or {}):
+            if name not in fieldnames and name not in (None, 'Error'):
+                fieldnames.append(name)
+    fieldnames.append('Error')
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for error in errors:
+        if error.get('data') is None:
+            continue
+        writer.writerow({**error['data'], 'Row': error['row'], 'Error': error['error']})
+    return output.getvalue()
+
+
+def read_error_rows(file):
+    """Đọc lại danh sách lỗi từ file do error_rows_csv tạo ra."""
+    errors = []
+    for row in open_csv(file):
+        line_no, message = row.pop('Row', ''), row.pop('Error', '')
+        errors.append({'row': int(line_no) if line_no.isdigit() else None, 'data': row, 'error': message})
+    return errors
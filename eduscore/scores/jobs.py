@@ -0,0 +1,142 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .imports import AttendanceImporter, error_rows_csv, open_csv, read_error_rows
+from .models import ImportJob
+
+# Số lỗi lưu trong ImportJob.errors và trả về khi hỏi trạng thái; danh sách đầy đủ nằm trong file CSV lỗi
+MAX_STORED_ERRORS = 1000
+# Job pending/running không có heartbeat (updated_date) lâu hơn mức này được xem là mồ côi và có thể resume
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+_executor = None
+_lock = threading.Lock()
+
+
+class JobLost(Exception):
+    """Job đã được resume và nhận bởi worker khác trong lúc worker này đang chạy."""
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+                thread_name_prefix='import-job'
+            )
+    return _executor
+
+
+def submit_import(job):
+    # Chỉ chạy job sau khi bản ghi ImportJob đã được commit
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.pk))
+
+
+def stored_errors(*error_lists):
+    """Tối đa MAX_STORED_ERRORS lỗi đầu tiên của các danh sách, không ghép toàn bộ danh sách."""
+    stored = []
+    for errors in error_lists:
+        stored.extend(errors[:MAX_STORED_ERRORS - len(stored)])
+    return stored
+
+
+def previous_run_errors(job):
+    # ImportJob.errors bị cắt bớt, file CSV lỗi của lần chạy trước mới có đủ danh sách
+    if job.error_file:
+        with job.error_file.open('rb') as file:
+            return read_error_rows(file)
+    return job.errors
+
+
+def claim_for_resume(job_id):
+    """Đưa job về pending để chạy tiếp, bằng một UPDATE có điều kiện.
+
+    Được nhận: job lỗi, hoặc job pending/running không có heartbeat trong STALE_AFTER (tiến trình chạy nó đã chết
+    hay khởi động lại, ThreadPoolExecutor mất theo). Hai request resume cùng lúc chỉ một request nhận được.
+    """
+    now = timezone.now()
+    stale = Q(status__in=('pending', 'running'), updated_date__lt=now - STALE_AFTER)
+    return bool(ImportJob.objects.filter(Q(status='failed') | stale, pk=job_id).update(status='pending', updated_date=now))
+
+
+def run_import_job(job_id, close_connections=True):
+    """Chạy (hoặc chạy tiếp từ checkpoint) một ImportJob."""
+    try:
+        # Nhận job: pending -> running và tăng attempt. Job đã có worker khác nhận (hoặc đã xong) thì bỏ qua
+        now = timezone.now()
+        if not ImportJob.objects.filter(pk=job_id, status='pending').update(
+                status='running', attempt=F('attempt') + 1, started_at=Coalesce('started_at', Value(now)),
+                updated_date=now):
+            return
+        job = ImportJob.objects.get(pk=job_id)
+        # Mọi lần ghi đều kèm attempt: job bị resume sang worker khác thì worker này không ghi đè được nữa
+        owned = ImportJob.objects.filter(pk=job_id, attempt=job.attempt)
+
+        # Chạy tiếp: chỉ giữ lỗi của các dòng trước checkpoint, các dòng sau sẽ được xử lý lại
+        previous_errors = [error for error in previous_run_errors(job) if error['row'] and error['row'] <= job.checkpoint]
+        processed_before = job.processed_rows
+        unchanged_before = job.unchanged_rows
+
+        def progress(importer):
+            # updated_date là heartbeat, cập nhật sau mỗi lô
+            if not owned.update(
+                checkpoint=importer.checkpoint,
+                errors=stored_errors(previous_errors, importer.errors),
+                failed_rows=len(previous_errors) + len(importer.errors),
+                processed_rows=processed_before + importer.processed,
+                unchanged_rows=unchanged_before + importer.unchanged,
+                rows_per_second=importer.rows_per_second,
+                updated_date=timezone.now(),
+            ):
+                raise JobLost(f"Import job {job_id} was resumed by another worker.")
+
+        importer = AttendanceImporter(on_progress=progress, partial=job.partial, start_after=job.checkpoint)
+        failure = None
+        try:
+            with job.file.open('rb') as file:
+                importer.run(open_csv(file), chunk_size=job.chunk_size)
+        except JobLost:
+            return
+        except Exception as e:
+            failure = str(e)
+
+        errors = previous_errors + importer.errors
+        # Chế độ partial: job vẫn hoàn thành dù có dòng lỗi, các dòng lỗi được xuất ra file riêng
+        if failure or (importer.errors and not job.partial):
+            job.status = 'failed'
+        else:
+            job.status = 'completed'
+
+        if errors:
+            job.error_file.save(f'import_{job.pk}_errors.csv',
+                                ContentFile(error_rows_csv(errors).encode('utf-8-sig')), save=False)
+        else:
+            job.error_file = None
+
+        now = timezone.now()
+        owned.update(
+            status=job.status,
+            checkpoint=importer.checkpoint,
+            processed_rows=processed_before + importer.processed,
+            unchanged_rows=unchanged_before + importer.unchanged,
+            rows_per_second=importer.rows_per_second,
+            errors=stored_errors(errors),
+            failed_rows=len(errors),
+            failure_reason=failure or '',
+            error_file=job.error_file.name or None,
+            finished_at=now,
+            updated_date=now,
+        )
+    finally:
+        if close_connections:
+            # Mỗi luồng worker giữ kết nối riêng, đóng lại khi xong job
+            connections.close_all()
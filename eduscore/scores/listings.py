@@ -0,0 +1,45 @@
+import hashlib
+
+from django.core.cache import cache
+
+from . import search, versions
+
+# Dữ liệu gắn với version hoạt động nên TTL chỉ dùng để dọn cache
+ACTIVITY_LIST_CACHE_TIMEOUT = 10 * 60
+
+# Các tham số làm thay đổi kết quả danh sách hoạt động; tham số khác bị bỏ qua khi tạo khoá
+ACTIVITY_LIST_PARAMS = ('category_id', 'tag', 'q', 'page', 'page_size', 'count', 'cursor')
+
+
+def activity_list_params(request):
+    params = {}
+    for name in ACTIVITY_LIST_PARAMS:
+        value = request.query_params.get(name)
+        # Tham số rỗng được view coi như không có (riêng cursor= rỗng là trang đầu của chế độ cursor)
+        if value is None or (not value and name != 'cursor'):
+            continue
+        if name == 'q':
+            # Cùng bộ từ sau khi bỏ dấu/chữ hoa thì cùng kết quả tìm kiếm
+            value = ' '.join(search.tokens(value))
+        params[name] = value
+    if params.get('page') == '1':
+        del params['page']
+    return params
+
+
+def activity_list_key(request):
+    version, _ = versions.get_version(versions.ACTIVITIES)
+    params = '&'.join(f'{name}={value}' for name, value in sorted(activity_list_params(request).items()))
+    # Ảnh và link phân trang là URL tuyệt đối nên khoá gồm cả scheme/host
+    digest = hashlib.sha1(f'{request.build_absolute_uri("/")}?{params}'.encode()).hexdigest()
+    return f'activity-list:{version}:{digest}'
+
+
+def cached_activity_list(request, compute):
+    """Dữ liệu trả về của danh sách hoạt động, đọc từ cache theo bộ lọc đã chuẩn hoá; compute() tính khi chưa có."""
+    key = activity_list_key(request)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, ACTIVITY_LIST_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,107 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scores import search
+from scores.models import Activity, Category, User
+
+PHRASES = [
+    'Hoạt động tình nguyện', 'Mùa hè xanh', 'Hiến máu nhân đạo', 'Hội thảo khoa học', 'Chào tân sinh viên',
+    'Kỹ năng mềm', 'Đoàn thanh niên', 'Bảo vệ môi trường', 'Cuộc thi lập trình', 'Câu lạc bộ tiếng Anh',
+    'Về nguồn Hà Nội', 'Lễ ra quân',
+]
+# Có âm tiết ngắn (hè, hà, lễ, ra) mà FULLTEXT của MySQL không lập chỉ mục
+SHORT_WORD_QUERIES = ['Mùa hè xanh', 'Hà Nội', 'Lễ ra quân']
+SYLLABLES = [
+    'an', 'bình', 'cường', 'dũng', 'đức', 'giang', 'hà', 'hải', 'hòa', 'hùng', 'khánh', 'lâm', 'linh', 'long',
+    'minh', 'nam', 'nghĩa', 'ngọc', 'phong', 'phúc', 'quang', 'sơn', 'tâm', 'thành', 'thảo', 'thịnh', 'trung',
+    'tuấn', 'việt', 'vinh', 'xuân', 'yên', 'bảo', 'châu', 'diệp', 'gia', 'huy', 'kiên', 'lộc', 'mai',
+]
+# Khoảng 1600 từ ghép: mỗi từ xuất hiện trong vài trăm hoạt động, gần với dữ liệu thật hơn một bộ từ nhỏ
+VOCABULARY = [first + second for first in SYLLABLES for second in SYLLABLES if first != second]
+
+
+class Command(BaseCommand):
+    help = ('Measure activity search latency against the legacy title__icontains filter on synthetic '
+            'activities. Everything is created inside a transaction that is rolled back; on MySQL, where '
+            'FULLTEXT only sees committed rows, the data is committed and deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activities', type=int, default=100000, help='Number of synthetic activities.')
+        parser.add_argument('--rounds', type=int, default=20, help='Timed runs per query.')
+        parser.add_argument('--page-size', type=int, default=20, help='Rows fetched per search.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if search.backend() != 'mysql':
+            with transaction.atomic():
+                self.run(options)
+                transaction.set_rollback(True)
+            return
+
+        # InnoDB chỉ cập nhật chỉ mục FULLTEXT khi commit, dữ liệu trong transaction chưa commit không tìm thấy được
+        self.user = self.category = None
+        try:
+            self.run(options)
+        finally:
+            if self.user is not None:
+                Activity.objects.filter(created_by=self.user).delete()
+                self.user.delete()
+            if self.category is not None:
+                self.category.delete()
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+
+        started = time.perf_counter()
+        self.populate(options['activities'], rng)
+        self.stdout.write(f"Created {options['activities']} activities in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        count = search.index_activities()
+        self.stdout.write(f'Indexed {count} activities ({search.backend()}) in {time.perf_counter() - started:.2f}s')
+
+        queries = [rng.choice(PHRASES) for _ in range(4)] + [search.fold(rng.choice(PHRASES)) for _ in range(2)]
+        queries += rng.sample(VOCABULARY, 6) + SHORT_WORD_QUERIES
+        page = slice(0, options['page_size'])
+        activities = Activity.objects.filter(active=True)
+        self.report('search', queries, options['rounds'], lambda q: search.load_ranked(
+            activities, search.ranked_ids(activities, search.search_activity_ids(q))[page]
+        ))
+        self.report('title__icontains', queries, options['rounds'], lambda q: list(
+            activities.filter(title__icontains=q)[page]
+        ))
+
+    def populate(self, count, rng, batch_size=5000):
+        self.user = user = User.objects.create(username=f'benchmark-{time.time_ns()}', role='admin')
+        self.category = category = Category.objects.create(name=f'benchmark-{time.time_ns()}')
+        today = datetime.date.today()
+
+        for start in range(0, count, batch_size):
+            Activity.objects.bulk_create([
+                Activity(
+                    title=' '.join(rng.sample(VOCABULARY, 4) + ([rng.choice(PHRASES)] if rng.random() < 0.05 else [])),
+                    description=f"<p>{' '.join(rng.sample(VOCABULARY, 20))}</p>",
+                    start_date=today, end_date=today, created_by=user, capacity=100, category=category,
+                )
+                for _ in range(min(batch_size, count - start))
+            ])
+
+    def report(self, name, queries, rounds, run):
+        timings, hits = [], 0
+        for query in queries:
+            for _ in range(rounds):
+                started = time.perf_counter()
+                hits += bool(run(query))
+                timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f'{name:>18}: p50 {statistics.median(timings):.2f}ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms, max {timings[-1]:.2f}ms, '
+            f'{hits}/{len(timings)} runs with results'
+        )
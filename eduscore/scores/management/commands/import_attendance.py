@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scores.imports import AttendanceImporter, open_csv
+
+
+class Command(BaseCommand):
+    help = 'Import an attendance CSV (Student ID, Activity ID, Attendance, Score) and report throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the CSV file (plain or gzip-compressed).')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Commit every N rows instead of importing the whole file in one transaction.')
+
+    def handle(self, *args, **options):
+        importer = AttendanceImporter()
+        with open(options['path'], 'rb') as csv_file:
+            ok = importer.run(open_csv(csv_file), chunk_size=options['chunk_size'])
+
+        summary = importer.summary()
+        if not ok:
+            for error in importer.errors[:20]:
+                self.stderr.write(f"Row {error['row']}: {error['error']}")
+            raise CommandError(f"{summary['failed']} invalid rows, stopped after {summary['rows']} imported rows.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows in {summary['elapsed']:.2f}s ({summary['rows_per_second']:.0f} rows/s)."
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scores.scoring import rebuild_group_scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-student, per-group score aggregate table from DisciplinePoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, nargs='*', dest='students',
+                            help='Only rebuild rows for these student IDs.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_group_scores(options['students'] or None)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} group score rows in {elapsed:.2f}s.'))
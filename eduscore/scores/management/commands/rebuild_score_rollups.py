@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scores import versions
+from scores.models import ClassScoreRollup, DepartmentScoreRollup
+from scores.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-class and per-department score rollup tables from User.total_score.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuild_rollups()
+        versions.bump_version(versions.SCORES)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {ClassScoreRollup.objects.count()} class and '
+            f'{DepartmentScoreRollup.objects.count()} department rollup rows in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scores.search import backend, index_activities
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the activity full-text search index (title, plain-text description and tags).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of activities indexed per batch.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = index_activities(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} activities ({backend()}) in {elapsed:.2f}s.'))
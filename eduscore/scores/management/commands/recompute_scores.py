@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from scores.scoring import recompute_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute DisciplinePoint.group_total_score and User.total_score with set-based SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', type=int, dest='class_id', help='Only students of this class.')
+        parser.add_argument('--department', type=int, dest='department_id',
+                            help='Only students of this department.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of students recomputed per transaction.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Run chunks in a process pool with this many workers.')
+
+    def handle(self, *args, **options):
+        def progress(students, points, elapsed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {students} students, {points} points ({elapsed:.2f}s)')
+
+        result = recompute_all(
+            class_id=options['class_id'],
+            department_id=options['department_id'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            callback=progress,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {result['students']} students and {result['points']} points "
+            f"in {result['chunks']} chunks, {result['elapsed']:.2f}s "
+            f"({result['students_per_second']:.0f} students/s, {result['points_per_second']:.0f} points/s)."
+        ))
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_group_scores(apps, schema_editor):
+    # Cùng câu INSERT ... SELECT với scoring.rebuild_group_scores()
+    point_table = apps.get_model('scores', 'DisciplinePoint')._meta.db_table
+    criteria_table = apps.get_model('scores', 'EvaluationCriteria')._meta.db_table
+    group_table = apps.get_model('scores', 'EvaluationGroup')._meta.db_table
+    score_table = apps.get_model('scores', 'StudentGroupScore')._meta.db_table
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {score_table} (student_id, group_id, raw_score, capped_score, updated_date) "
+            f"SELECT dp.student_id, c.group_id, SUM(dp.score), "
+            f"CASE WHEN SUM(dp.score) > g.max_score THEN g.max_score ELSE SUM(dp.score) END, %s "
+            f"FROM {point_table} dp "
+            f"INNER JOIN {criteria_table} c ON dp.criteria_id = c.id "
+            f"INNER JOIN {group_table} g ON c.group_id = g.id "
+            f"GROUP BY dp.student_id, c.group_id, g.max_score",
+            [timezone.now()]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0022_alter_user_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentGroupScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('raw_score', models.FloatField(default=0)),
+                ('capped_score', models.FloatField(default=0)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scores.evaluationgroup')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('student', 'group')},
+            },
+        ),
+        migrations.RunPython(fill_group_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0024_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='checkpoint',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='error_file',
+            field=models.FileField(blank=True, null=True, upload_to='imports/errors/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='partial',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
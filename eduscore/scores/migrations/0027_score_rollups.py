@@ -0,0 +1,77 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def fill_rollups(apps, schema_editor):
+    # Giống rollups.rebuild_rollups() nhưng dùng model lịch sử
+    User = apps.get_model('scores', 'User')
+    buckets = {
+        'excellent': Q(total_score__gte=90),
+        'good': Q(total_score__gte=75, total_score__lt=90),
+        'average': Q(total_score__gte=50, total_score__lt=75),
+        'poor': Q(total_score__lt=50),
+    }
+    aggregates = {
+        'student_count': Count('id'),
+        'score_sum': Sum('total_score'),
+        'score_sum_squares': Sum(F('total_score') * F('total_score')),
+        **{name: Count('id', filter=condition) for name, condition in buckets.items()},
+    }
+
+    for model_name, key_field in (('ClassScoreRollup', 'student_class_id'), ('DepartmentScoreRollup', 'department_id')):
+        model = apps.get_model('scores', model_name)
+        rows = User.objects.order_by().values(key_field).annotate(**aggregates)
+        rollups = [model(**{key_field: row.pop(key_field)}, **row) for row in rows]
+        if not any(getattr(rollup, key_field) is None for rollup in rollups):
+            rollups.append(model(**{key_field: None}))
+        model.objects.bulk_create(rollups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0026_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_count', models.IntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_sum_squares', models.FloatField(default=0)),
+                ('excellent', models.IntegerField(default=0)),
+                ('good', models.IntegerField(default=0)),
+                ('average', models.IntegerField(default=0)),
+                ('poor', models.IntegerField(default=0)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('student_class', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='score_rollup', to='scores.class')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DepartmentScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_count', models.IntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_sum_squares', models.FloatField(default=0)),
+                ('excellent', models.IntegerField(default=0)),
+                ('good', models.IntegerField(default=0)),
+                ('average', models.IntegerField(default=0)),
+                ('poor', models.IntegerField(default=0)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('department', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='score_rollup', to='scores.department')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
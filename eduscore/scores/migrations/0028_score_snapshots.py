@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0027_score_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('student_count', models.IntegerField(default=0)),
+                ('avg_score', models.FloatField(default=0)),
+                ('std_score', models.FloatField(default=0)),
+                ('student_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_snapshots', to='scores.class')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='scores_clas_date_4dc7ad_idx')],
+                'unique_together': {('student_class', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_score', models.FloatField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('student', 'date')},
+            },
+        ),
+    ]
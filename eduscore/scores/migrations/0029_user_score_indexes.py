@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('scores', '0028_score_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['student_class', '-total_score'], name='user_class_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['department', '-total_score'], name='user_department_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-total_score'], name='user_score_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:38
+
+import html
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+INDEX_TABLE = 'scores_activitysearchindex'
+FTS_TABLE = 'scores_activitysearchindex_fts'
+
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, body, content='{INDEX_TABLE}', "
+    f"content_rowid='activity_id', tokenize='unicode61')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.activity_id, new.title, new.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.activity_id, old.title, old.body); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.activity_id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.activity_id, new.title, new.body); END",
+]
+
+
+def create_fulltext(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'mysql':
+        schema_editor.execute(f"ALTER TABLE {INDEX_TABLE} ADD FULLTEXT INDEX activity_search_ft (title, body)")
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Không có FTS5: tìm kiếm dùng icontains trên văn bản đã bỏ dấu
+                return
+        for sql in SQLITE_FTS:
+            schema_editor.execute(sql)
+
+
+def drop_fulltext(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'mysql':
+        schema_editor.execute(f"ALTER TABLE {INDEX_TABLE} DROP INDEX activity_search_ft")
+    elif connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+# Bản sao search.fold / search.plain_text tại thời điểm tạo migration, để migration không phụ thuộc code hiện tại
+def fold(text):
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def plain_text(rich_text):
+    return html.unescape(strip_tags(rich_text or ''))
+
+
+def fill_index(apps, schema_editor, batch_size=1000):
+    # Như search.index_activities() nhưng dùng model lịch sử; chạy sau khi có trigger FTS nên bảng FTS cũng được nạp
+    Activity = apps.get_model('scores', 'Activity')
+    ActivitySearchIndex = apps.get_model('scores', 'ActivitySearchIndex')
+    ActivityTag = Activity._meta.get_field('tags').remote_field.through
+
+    rows = Activity.objects.order_by('id').values_list('id', 'title', 'description')
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+
+        tags = {}
+        for activity_id, tag_name in ActivityTag.objects.filter(
+                activity_id__in=[row[0] for row in batch]).values_list('activity_id', 'tag__name'):
+            tags.setdefault(activity_id, []).append(tag_name)
+
+        ActivitySearchIndex.objects.bulk_create([
+            ActivitySearchIndex(activity_id=activity_id, title=fold(title),
+                                body=fold(' '.join([plain_text(description), *tags.get(activity_id, ())])))
+            for activity_id, title, description in batch
+        ])
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0029_user_score_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivitySearchIndex',
+            fields=[
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='scores.activity')),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_fulltext, drop_fulltext),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_registrations(apps, schema_editor):
+    Activity = apps.get_model('scores', 'Activity')
+    Registration = apps.get_model('scores', 'Registration')
+    counts = (
+        Registration.objects.filter(activity_id=OuterRef('pk'), active=True)
+        .order_by().values('activity_id').annotate(count=Count('id')).values('count')
+    )
+    Activity.objects.update(registered_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0030_activity_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='registered_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_registrations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('scores', '0032_registration_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', '-total_score'], name='user_role_score_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0033_user_role_score_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='disciplinepoint',
+            index=models.Index(fields=['updated_date', 'id'], name='discipline_updated_idx'),
+        ),
+    ]
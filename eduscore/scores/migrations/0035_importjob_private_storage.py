@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:18
+
+import scores.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def move_import_files(apps, schema_editor):
+    # File đã tải lên trước đây nằm trong MEDIA_ROOT (được phục vụ công khai): chuyển sang bộ lưu trữ riêng, giữ tên
+    ImportJob = apps.get_model('scores', 'ImportJob')
+    private = ImportJob._meta.get_field('file').storage
+    for names in ImportJob.objects.values_list('file', 'error_file'):
+        for name in names:
+            if not name or not default_storage.exists(name) or private.exists(name):
+                continue
+            with default_storage.open(name, 'rb') as file:
+                private.save(name, file)
+            default_storage.delete(name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0034_discipline_point_updated_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='error_file',
+            field=models.FileField(blank=True, null=True, storage=scores.models.private_storage, upload_to='imports/errors/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(storage=scores.models.private_storage, upload_to='imports/%Y/%m/'),
+        ),
+        migrations.RunPython(move_import_files, migrations.RunPython.noop),
+    ]
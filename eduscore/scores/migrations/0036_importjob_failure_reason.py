@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+def move_failures(apps, schema_editor):
+    # Trước đây lỗi của cả lần chạy được thêm vào cuối errors dưới dạng {'row': None, 'data': None, 'error': ...}
+    ImportJob = apps.get_model('scores', 'ImportJob')
+    for job in ImportJob.objects.only('id', 'errors', 'failed_rows'):
+        failures = [error for error in job.errors if error.get('row') is None and error.get('data') is None]
+        if not failures:
+            continue
+        job.errors = [error for error in job.errors if error not in failures]
+        job.failure_reason = failures[-1]['error']
+        job.failed_rows = max(job.failed_rows - len(failures), 0)
+        job.save(update_fields=['errors', 'failure_reason', 'failed_rows'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0035_importjob_private_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='failure_reason',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(move_failures, migrations.RunPython.noop),
+    ]
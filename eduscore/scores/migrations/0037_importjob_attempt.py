@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0036_importjob_failure_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='attempt',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
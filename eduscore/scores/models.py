@@ -1,6 +1,10 @@
-from django.db import models
+import os
 
 from django.db import models
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser
 from ckeditor.fields import RichTextField
 
@@ -16,6 +20,25 @@ class User(AbstractUser):
     total_score = models.FloatField(default=0)
     role = models.CharField(max_length=10, choices=ROLES, default='student')
 
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        # total_score chỉ thay đổi bằng F() (rollups.add_to_total_score) hoặc tính lại bằng SQL (scoring);
+        # lưu cả đối tượng đọc từ trước không được ghi đè lại giá trị cũ
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'total_score']
+        super().save(*args, **kwargs)
+
+    class Meta(AbstractUser.Meta):
+        # Bảng xếp hạng: top-N theo lớp/khoa/toàn trường là một lần quét chỉ mục có giới hạn
+        indexes = [
+            models.Index(fields=['student_class', '-total_score'], name='user_class_score_idx'),
+            models.Index(fields=['department', '-total_score'], name='user_department_score_idx'),
+            models.Index(fields=['-total_score'], name='user_score_idx'),
+            # Đếm số sinh viên điểm cao hơn khi xếp hạng toàn trường
+            models.Index(fields=['role', '-total_score'], name='user_role_score_idx'),
+        ]
+
 class BaseModel(models.Model):
     active = models.BooleanField(default=True)
     created_date = models.DateTimeField(auto_now_add=True)
@@ -53,6 +76,8 @@ class Activity(BaseModel):
     end_date = models.DateField()
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     capacity = models.PositiveIntegerField()
+    # Số đăng ký đang hoạt động, chỉ cập nhật bằng UPDATE có điều kiện trong scores.registrations
+    registered_count = models.PositiveIntegerField(default=0, editable=False)
     image = models.ImageField(upload_to='activities/%Y/%m/', null=True, blank=True)
     status = models.CharField(
         max_length=20,
@@ -63,6 +88,23 @@ class Activity(BaseModel):
     tags = models.ManyToManyField('Tag')
     max_score = models.FloatField(default=0)
 
+    def save(self, *args, **kwargs):
+        # registered_count chỉ tăng/giảm bằng F(); lưu cả đối tượng không được ghi đè bằng giá trị đã đọc từ trước
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'registered_count']
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.title
+
+class ActivitySearchIndex(models.Model):
+    # Văn bản đã bỏ dấu, chữ thường; MySQL có FULLTEXT trên (title, body), SQLite có bảng FTS5 đồng bộ bằng trigger
+    activity = models.OneToOneField(Activity, related_name='search_index', primary_key=True, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.title
 
@@ -101,15 +143,43 @@ class DisciplinePoint(BaseModel):
     score = models.FloatField(default=0)
     group_total_score = models.FloatField(default=0)
 
+    class Meta(BaseModel.Meta):
+        # Xuất theo phần thay đổi: MAX(updated_date) và phân trang theo (updated_date, id)
+        indexes = [models.Index(fields=['updated_date', 'id'], name='discipline_updated_idx')]
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        if not self.pk:
+        from scores import scoring
+
+        if scoring.is_deferred():
+            # Đang ghi hàng loạt: chỉ đánh dấu sinh viên, điểm sẽ được tính lại một lần khi flush
+            if self.pk:
+                scoring.mark_dirty(*DisciplinePoint.objects.filter(pk=self.pk).values_list('student_id', flat=True))
             super().save(*args, **kwargs)
+            scoring.mark_dirty(self.student_id)
+            return
+
+        previous = None
+        if self.pk:
+            previous = DisciplinePoint.objects.filter(pk=self.pk).values(
+                'student_id', 'score', 'criteria__group_id', 'criteria__group__max_score'
+            ).first()
 
         self.calculate_group_total_score()
 
-        super().save(update_fields=['group_total_score'])
+        super().save(*args, **kwargs)
 
-        self.update_student_total_score()
+        # Chỉ cộng phần chênh lệch điểm cho (sinh viên, nhóm) bị ảnh hưởng
+        deltas = {}
+        if previous:
+            key = (previous['student_id'], previous['criteria__group_id'], previous['criteria__group__max_score'])
+            deltas[key] = -previous['score']
+        group = self.criteria.group
+        key = (self.student_id, group.id, group.max_score)
+        deltas[key] = deltas.get(key, 0) + self.score
+
+        for (student_id, group_id, max_score), delta in deltas.items():
+            self.apply_score_delta(student_id, group_id, max_score, delta)
 
     def calculate_group_total_score(self):
         evaluation_group = self.criteria.group
@@ -124,21 +194,114 @@ class DisciplinePoint(BaseModel):
 
         self.group_total_score = min(group_total, evaluation_group.max_score)
 
-    def update_student_total_score(self):
-        evaluation_groups = EvaluationGroup.objects.all()
+    def apply_score_delta(self, student_id, group_id, max_score, delta):
+        from scores import rollups, versions
+
+        if not delta:
+            return
 
-        total_score = 0
+        lookup = {'student_id': student_id, 'group_id': group_id}
+        group_score = StudentGroupScore.objects.select_for_update().filter(**lookup).first()
 
-        for group in evaluation_groups:
-            group_total = DisciplinePoint.objects.filter(
-                student=self.student,
-                criteria__group=group
+        if group_score is None:
+            # Chưa có dòng tổng hợp: khởi tạo từ lịch sử điểm (đã bao gồm delta)
+            raw_total = DisciplinePoint.objects.filter(
+                student_id=student_id,
+                criteria__group_id=group_id
             ).aggregate(total=models.Sum('score'))['total'] or 0
 
-            total_score += min(group_total, group.max_score)
+            try:
+                with transaction.atomic():
+                    created = StudentGroupScore.objects.create(
+                        **lookup, raw_score=raw_total, capped_score=min(raw_total, max_score)
+                    )
+            except IntegrityError:
+                # Giao dịch khác vừa tạo dòng này từ lịch sử chưa gồm điểm của mình: khoá lại rồi cộng delta như thường
+                group_score = StudentGroupScore.objects.select_for_update().get(**lookup)
+            else:
+                change = created.capped_score - min(raw_total - delta, max_score)
+
+        if group_score is not None:
+            old_capped = group_score.capped_score
+            group_score.raw_score += delta
+            group_score.capped_score = min(group_score.raw_score, max_score)
+            group_score.save(update_fields=['raw_score', 'capped_score', 'updated_date'])
+            change = group_score.capped_score - old_capped
+
+        if not change:
+            return
+
+        rollups.add_to_total_score(student_id, change)
+        versions.bump_version(versions.SCORES)
+
+        if student_id == self.student_id and DisciplinePoint.student.is_cached(self):
+            self.student.total_score += change
+
+class StudentGroupScore(models.Model):
+    student = models.ForeignKey(User, related_name='group_scores', on_delete=models.CASCADE)
+    group = models.ForeignKey(EvaluationGroup, on_delete=models.CASCADE)
+    raw_score = models.FloatField(default=0)
+    capped_score = models.FloatField(default=0)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'group')
+
+    def __str__(self):
+        return f"{self.student} - {self.group}: {self.capped_score}"
+
+class ScoreRollup(models.Model):
+    student_count = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sum_squares = models.FloatField(default=0)
+    excellent = models.IntegerField(default=0)
+    good = models.IntegerField(default=0)
+    average = models.IntegerField(default=0)
+    poor = models.IntegerField(default=0)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+class ClassScoreRollup(ScoreRollup):
+    # student_class rỗng: sinh viên chưa được xếp lớp
+    student_class = models.OneToOneField(Class, related_name='score_rollup', null=True, blank=True,
+                                         on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.student_class}: {self.student_count}"
+
+class DepartmentScoreRollup(ScoreRollup):
+    department = models.OneToOneField(Department, related_name='score_rollup', null=True, blank=True,
+                                      on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.department}: {self.student_count}"
 
-        self.student.total_score = total_score
-        self.student.save()
+class ClassScoreSnapshot(models.Model):
+    date = models.DateField()
+    student_class = models.ForeignKey(Class, related_name='score_snapshots', on_delete=models.CASCADE)
+    student_count = models.IntegerField(default=0)
+    avg_score = models.FloatField(default=0)
+    std_score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('student_class', 'date')
+        indexes = [models.Index(fields=['date'])]
+
+    def __str__(self):
+        return f"{self.student_class} {self.date}: {self.avg_score}"
+
+class StudentScoreSnapshot(models.Model):
+    date = models.DateField()
+    student = models.ForeignKey(User, related_name='score_snapshots', on_delete=models.CASCADE)
+    total_score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('student', 'date')
+
+    def __str__(self):
+        return f"{self.student} {self.date}: {self.total_score}"
 
 class Report(BaseModel):
     student = models.ForeignKey(User,  related_name='student_reports', on_delete=models.CASCADE)
@@ -172,6 +335,20 @@ class Registration(BaseModel):
     def __str__(self):
         return f"{self.student.username} - {self.activity.title}"
 
+class WaitlistEntry(models.Model):
+    # Hàng đợi FIFO theo id trong từng hoạt động, mỗi sinh viên tối đa một chỗ
+    activity = models.ForeignKey(Activity, related_name='waitlist', on_delete=models.CASCADE)
+    student = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('activity', 'student')
+        indexes = [models.Index(fields=['activity', 'id'])]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.student.username} - {self.activity.title}"
+
 class Tag(BaseModel):
     name = models.CharField(max_length=50, unique=True)
     def __str__(self):
@@ -202,4 +379,46 @@ class Message(BaseModel):
         ordering = ['-timestamp']
 
     def __str__(self):
-        return f"Message from {self.sender} to {self.receiver}"
\ No newline at end of file
+        return f"Message from {self.sender} to {self.receiver}"
+
+def private_storage():
+    # File điểm danh và file dòng lỗi chứa mã sinh viên và điểm: lưu ngoài MEDIA_ROOT (được phục vụ công khai),
+    # chỉ tải về qua API có xác thực
+    return FileSystemStorage(location=getattr(settings, 'PRIVATE_MEDIA_ROOT', os.path.join(settings.BASE_DIR, 'private')))
+
+class ImportJob(BaseModel):
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    created_by = models.ForeignKey(User, related_name='import_jobs', null=True, blank=True, on_delete=models.SET_NULL)
+    file = models.FileField(upload_to='imports/%Y/%m/', storage=private_storage)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    chunk_size = models.PositiveIntegerField(default=1000)
+    partial = models.BooleanField(default=False)
+    checkpoint = models.PositiveIntegerField(default=0)
+    # Tăng mỗi lần một worker nhận job; worker chỉ ghi tiến độ khi attempt vẫn là của mình
+    attempt = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    unchanged_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    # Lỗi làm dừng cả lần chạy (không gắn với dòng nào), tách khỏi errors để không bị cắt theo MAX_STORED_ERRORS
+    failure_reason = models.TextField(blank=True)
+    error_file = models.FileField(upload_to='imports/errors/%Y/%m/', storage=private_storage, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status})"
+
+class DataVersion(models.Model):
+    key = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=1)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -1,5 +1,108 @@
+import base64
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ItemPaginator(pagination.PageNumberPagination):
-    page_size = 2
\ No newline at end of file
+    page_size = 2
+
+
+class FeedPaginator(ItemPaginator):
+    """Phân trang theo số trang như ItemPaginator (mặc định, giữ tương thích), cộng thêm:
+
+    - ?page_size=N (tối đa max_page_size)
+    - ?count=0: bỏ COUNT(*), chỉ đọc thêm một dòng để biết còn trang sau hay không
+    - ?cursor= (rỗng ở trang đầu): phân trang keyset theo (created_date, id) giảm dần, không dùng OFFSET
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-created_date', '-id')
+
+    mode = 'page'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if self.cursor_query_param in request.query_params and isinstance(queryset, QuerySet):
+            self.mode = 'cursor'
+            return self.paginate_cursor(queryset, request)
+        if isinstance(queryset, QuerySet):
+            queryset = self.with_tie_breaker(queryset)
+        if request.query_params.get(self.count_query_param) in ('0', 'false'):
+            self.mode = 'uncounted'
+            return self.paginate_uncounted(queryset, request)
+        self.mode = 'page'
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def with_tie_breaker(queryset):
+        # Phân trang bằng OFFSET cần thứ tự toàn phần, nếu không các dòng trùng created_date có thể lặp/mất giữa các trang
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering or any(field.lstrip('-') in ('id', 'pk') for field in ordering if isinstance(field, str)):
+            return queryset
+        return queryset.order_by(*ordering, '-id')
+
+    def get_paginated_response(self, data):
+        if self.mode == 'page':
+            return super().get_paginated_response(data)
+        return Response({'next': self.next_link, 'previous': self.previous_link, 'results': data})
+
+    def paginate_uncounted(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise NotFound('Invalid page.')
+
+        start = (number - 1) * page_size
+        rows = list(queryset[start:start + page_size + 1])
+
+        url = request.build_absolute_uri()
+        self.next_link = replace_query_param(url, self.page_query_param, number + 1) \
+            if len(rows) > page_size else None
+        self.previous_link = None
+        if number > 1:
+            self.previous_link = replace_query_param(url, self.page_query_param, number - 1) \
+                if number > 2 else remove_query_param(url, self.page_query_param)
+        return rows[:page_size]
+
+    def paginate_cursor(self, queryset, request):
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_date__lt=created_date) | Q(created_date=created_date, id__lt=pk))
+
+        rows = list(queryset[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        url = remove_query_param(request.build_absolute_uri(), self.page_query_param)
+        self.next_link = replace_query_param(url, self.cursor_query_param, self.encode_cursor(rows[-1])) \
+            if has_next else None
+        self.previous_link = None
+        return rows
+
+    def encode_cursor(self, obj):
+        return base64.urlsafe_b64encode(f'{obj.created_date.isoformat()}|{obj.pk}'.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_date = parse_datetime(created_date)
+            pk = int(pk)
+        except (ValueError, TypeError, UnicodeError):
+            created_date = None
+        if created_date is None:
+            raise NotFound('Invalid cursor.')
+        return created_date, pk
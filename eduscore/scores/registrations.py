@@ -0,0 +1,106 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Activity, Registration, WaitlistEntry
+
+
+class ActivityFull(Exception):
+    pass
+
+
+class AlreadyRegistered(Exception):
+    pass
+
+
+def claim_seat(activity_id):
+    """Giữ một chỗ bằng một câu UPDATE ... WHERE registered_count < capacity.
+
+    Câu lệnh là nguyên tử nên khi nhiều request cùng tranh chỗ cuối chỉ đúng số chỗ còn lại được trả về True,
+    không cần đọc trước rồi mới ghi.
+    """
+    return Activity.objects.filter(pk=activity_id, registered_count__lt=F('capacity')) \
+        .update(registered_count=F('registered_count') + 1) == 1
+
+
+def release_seats(activity_id, count=1):
+    Activity.objects.filter(pk=activity_id, registered_count__gte=count) \
+        .update(registered_count=F('registered_count') - count)
+
+
+def register(student, activity):
+    """Đăng ký student vào activity; hết chỗ thì báo ActivityFull mà không đụng tới bảng Registration."""
+    with transaction.atomic():
+        if not claim_seat(activity.pk):
+            raise ActivityFull
+        try:
+            with transaction.atomic():
+                registration = Registration.objects.create(student=student, activity=activity)
+        except IntegrityError:
+            # Thoát khỏi transaction ngoài bằng exception nên chỗ vừa giữ cũng được hoàn lại
+            raise AlreadyRegistered
+        WaitlistEntry.objects.filter(activity=activity, student=student).delete()
+        return registration
+
+
+def join_waitlist(student, activity):
+    """Xếp student vào cuối hàng chờ (gọi lại nhiều lần vẫn chỉ một chỗ) rồi trả về trạng thái hiện tại."""
+    current = registration_status(student, activity.pk)
+    if current['status'] != 'none':
+        return current
+
+    WaitlistEntry.objects.get_or_create(activity=activity, student=student)
+    # Có thể vừa có người huỷ trước khi chỗ chờ được ghi: thử xếp chỗ ngay để không bỏ trống
+    promote(activity.pk)
+    return registration_status(student, activity.pk)
+
+
+@transaction.atomic
+def promote(activity_id):
+    """Chuyển người đầu hàng chờ thành đăng ký cho tới khi hết chỗ trống, ghi theo lô; trả về số người được xếp."""
+    # Khoá dòng Activity: các lần promote và claim_seat cùng hoạt động chạy tuần tự
+    activity = Activity.objects.select_for_update().filter(pk=activity_id) \
+        .values('capacity', 'registered_count').first()
+    if activity is None:
+        return 0
+    free = activity['capacity'] - activity['registered_count']
+    if free <= 0:
+        return 0
+
+    count = 0
+    while free > 0:
+        entries = list(WaitlistEntry.objects.filter(activity_id=activity_id).order_by('id').values_list('id', 'student_id')[:free])
+        if not entries:
+            break
+        registered = set(Registration.objects.filter(activity_id=activity_id, student_id__in=[student_id for _, student_id in entries])
+                         .values_list('student_id', flat=True))
+        promoted = [student_id for _, student_id in entries if student_id not in registered]
+
+        Registration.objects.bulk_create([Registration(activity_id=activity_id, student_id=student_id) for student_id in promoted])
+        Activity.objects.filter(pk=activity_id).update(registered_count=F('registered_count') + len(promoted))
+        WaitlistEntry.objects.filter(id__in=[entry_id for entry_id, _ in entries]).delete()
+        free -= len(promoted)
+        count += len(promoted)
+    return count
+
+
+def cancel(student, activity_id):
+    """Huỷ đăng ký (nhường chỗ cho hàng chờ) hoặc rời hàng chờ; trả về False nếu không có gì để huỷ."""
+    # post_delete của Registration trả lại chỗ và xếp người đầu hàng chờ sau khi commit
+    deleted, _ = Registration.objects.filter(student=student, activity_id=activity_id, active=True).delete()
+    if deleted:
+        return True
+    deleted, _ = WaitlistEntry.objects.filter(student=student, activity_id=activity_id).delete()
+    return bool(deleted)
+
+
+def registration_status(student, activity_id):
+    """registered / waitlisted (kèm vị trí, tính từ 1) / none: tối đa ba truy vấn theo chỉ mục, dùng cho client hỏi định kỳ."""
+    if Registration.objects.filter(student=student, activity_id=activity_id, active=True).exists():
+        return {'activity': activity_id, 'status': 'registered', 'position': None}
+
+    entry_id = WaitlistEntry.objects.filter(student=student, activity_id=activity_id).values_list('id', flat=True).first()
+    if entry_id is None:
+        return {'activity': activity_id, 'status': 'none', 'position': None}
+
+    position = WaitlistEntry.objects.filter(activity_id=activity_id, id__lte=entry_id).count()
+    return {'activity': activity_id, 'status': 'waitlisted', 'position': position}
@@ -0,0 +1,123 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import ClassScoreRollup, DepartmentScoreRollup, User
+
+BUCKETS = (
+    ('excellent', Q(total_score__gte=90)),
+    ('good', Q(total_score__gte=75, total_score__lt=90)),
+    ('average', Q(total_score__gte=50, total_score__lt=75)),
+    ('poor', Q(total_score__lt=50)),
+)
+BUCKET_FIELDS = tuple(name for name, _ in BUCKETS)
+
+# Mỗi bảng rollup gom sinh viên theo một khoá ngoại của User (cùng tên trên bảng rollup)
+ROLLUPS = (
+    (ClassScoreRollup, 'student_class_id'),
+    (DepartmentScoreRollup, 'department_id'),
+)
+
+# role không ảnh hưởng rollup nhưng quyết định sinh viên có được xếp hạng hay không (stats.student_rank)
+STATE_FIELDS = ('student_class_id', 'department_id', 'total_score', 'role')
+
+
+def bucket_for(score):
+    if score >= 90:
+        return 'excellent'
+    if score >= 75:
+        return 'good'
+    if score >= 50:
+        return 'average'
+    return 'poor'
+
+
+def student_states(student_ids=None, lock=False):
+    """{id: {student_class_id, department_id, total_score}} của các sinh viên, dùng làm ảnh chụp trước/sau."""
+    users = User.objects.select_for_update() if lock else User.objects.all()
+    if student_ids is not None:
+        users = users.filter(pk__in=list(student_ids))
+    return {row.pop('id'): row for row in users.values('id', *STATE_FIELDS)}
+
+
+def _contribute(deltas, key, state, sign):
+    score = state['total_score']
+    delta = deltas[key]
+    delta['student_count'] += sign
+    delta['score_sum'] += sign * score
+    delta['score_sum_squares'] += sign * score * score
+    delta[bucket_for(score)] += sign
+
+
+def record_changes(before, after):
+    """Cập nhật rollup theo phần chênh lệch giữa hai ảnh chụp {id: state}; thiếu id nghĩa là không tồn tại."""
+    from scores import stats
+
+    changed = [(before.get(student_id), after.get(student_id)) for student_id in before.keys() | after.keys()]
+    changed = [(old, new) for old, new in changed if old != new]
+    if not changed:
+        return
+    states = [state for pair in changed for state in pair if state is not None]
+    stats.forget_ranks({state['student_class_id'] for state in states}, {state['department_id'] for state in states})
+
+    for model, key_field in ROLLUPS:
+        deltas = defaultdict(Counter)
+        for old, new in changed:
+            if old is not None:
+                _contribute(deltas, old[key_field], old, -1)
+            if new is not None:
+                _contribute(deltas, new[key_field], new, 1)
+
+        # Cập nhật theo thứ tự khoá cố định: các worker recompute_all song song khoá dòng rollup cùng một thứ tự,
+        # không tạo deadlock trên MySQL
+        for key, delta in sorted(deltas.items(), key=lambda item: (item[0] is not None, item[0] or 0)):
+            changes = {field: F(field) + value for field, value in delta.items() if value}
+            if not changes:
+                continue
+            updated = model.objects.filter(**{key_field: key}).update(updated_date=timezone.now(), **changes)
+            if not updated:
+                rebuild_rollup(model, key_field, key)
+
+
+def _aggregates():
+    return {
+        'student_count': Count('id'),
+        'score_sum': Sum('total_score'),
+        'score_sum_squares': Sum(F('total_score') * F('total_score')),
+        **{name: Count('id', filter=condition) for name, condition in BUCKETS},
+    }
+
+
+def rebuild_rollup(model, key_field, key):
+    """Tính lại một dòng rollup từ bảng User (dùng khi dòng chưa tồn tại)."""
+    values = User.objects.filter(**{key_field: key}).aggregate(**_aggregates())
+    values['score_sum'] = values['score_sum'] or 0
+    values['score_sum_squares'] = values['score_sum_squares'] or 0
+    model.objects.update_or_create(**{key_field: key}, defaults=values)
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """Tính lại toàn bộ rollup lớp/khoa bằng một truy vấn GROUP BY cho mỗi bảng."""
+    from scores import stats
+
+    stats.forget_all_ranks()
+    for model, key_field in ROLLUPS:
+        model.objects.all().delete()
+        rows = User.objects.order_by().values(key_field).annotate(**_aggregates())
+        rollups = [model(**{key_field: row.pop(key_field)}, **row) for row in rows]
+        if not any(getattr(rollup, key_field) is None for rollup in rollups):
+            # Luôn có dòng cho nhóm rỗng (chưa xếp lớp/khoa) để cập nhật theo delta không phải tạo mới
+            rollups.append(model(**{key_field: None}))
+        model.objects.bulk_create(rollups)
+
+
+@transaction.atomic(savepoint=False)
+def add_to_total_score(student_id, change):
+    """Cộng change vào User.total_score (khoá dòng sinh viên) và cập nhật rollup theo delta."""
+    before = student_states([student_id], lock=True)
+    User.objects.filter(pk=student_id).update(total_score=F('total_score') + change)
+    record_changes(before, {pk: {**state, 'total_score': state['total_score'] + change} for pk, state in before.items()})
+
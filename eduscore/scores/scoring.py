@@ -0,0 +1,233 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import rollups, versions
+from .models import DisciplinePoint, EvaluationCriteria, EvaluationGroup, StudentGroupScore, User
+
+
+def _student_filter(column, student_ids):
+    if student_ids is None:
+        return '', []
+    student_ids = list(student_ids)
+    if not student_ids:
+        return ' AND 1 = 0', []
+    return f" AND {column} IN ({', '.join(['%s'] * len(student_ids))})", student_ids
+
+
+def rebuild_group_scores(student_ids=None):
+    """Tính lại bảng StudentGroupScore từ DisciplinePoint bằng một câu INSERT ... SELECT."""
+    point_table = DisciplinePoint._meta.db_table
+    criteria_table = EvaluationCriteria._meta.db_table
+    group_table = EvaluationGroup._meta.db_table
+    score_table = StudentGroupScore._meta.db_table
+
+    where, params = _student_filter('dp.student_id', student_ids)
+
+    with transaction.atomic():
+        rows = StudentGroupScore.objects.all()
+        if student_ids is not None:
+            rows = rows.filter(student_id__in=list(student_ids))
+        rows.delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {score_table} (student_id, group_id, raw_score, capped_score, updated_date) "
+                f"SELECT dp.student_id, c.group_id, SUM(dp.score), "
+                f"CASE WHEN SUM(dp.score) > g.max_score THEN g.max_score ELSE SUM(dp.score) END, %s "
+                f"FROM {point_table} dp "
+                f"INNER JOIN {criteria_table} c ON dp.criteria_id = c.id "
+                f"INNER JOIN {group_table} g ON c.group_id = g.id "
+                f"WHERE 1 = 1{where} "
+                f"GROUP BY dp.student_id, c.group_id, g.max_score",
+                [timezone.now()] + params
+            )
+            return cursor.rowcount
+
+
+def _update_group_totals(student_ids):
+    point_table = DisciplinePoint._meta.db_table
+    criteria_table = EvaluationCriteria._meta.db_table
+    group_table = EvaluationGroup._meta.db_table
+
+    if connection.vendor == 'mysql':
+        # MySQL không cho phép subquery tham chiếu bảng đang UPDATE, dùng bảng dẫn xuất (materialized)
+        where, params = _student_filter('p.student_id', student_ids)
+        outer_where, outer_params = _student_filter('dp.student_id', student_ids)
+        sql = (
+            f"UPDATE {point_table} dp "
+            f"INNER JOIN {criteria_table} c ON dp.criteria_id = c.id "
+            f"INNER JOIN {group_table} g ON c.group_id = g.id "
+            f"INNER JOIN ("
+            f"SELECT p.student_id, p.activity_id, pc.group_id, SUM(p.score) AS total "
+            f"FROM {point_table} p INNER JOIN {criteria_table} pc ON p.criteria_id = pc.id "
+            f"WHERE 1 = 1{where} "
+            f"GROUP BY p.student_id, p.activity_id, pc.group_id"
+            f") t ON t.student_id = dp.student_id AND t.activity_id = dp.activity_id AND t.group_id = c.group_id "
+            f"SET dp.group_total_score = LEAST(t.total, g.max_score) "
+            f"WHERE 1 = 1{outer_where}"
+        )
+        params = params + outer_params
+    else:
+        where, params = _student_filter(f'{point_table}.student_id', student_ids)
+        sql = (
+            f"UPDATE {point_table} SET group_total_score = ("
+            f"SELECT CASE WHEN SUM(p.score) > g.max_score THEN g.max_score ELSE SUM(p.score) END "
+            f"FROM {point_table} p "
+            f"INNER JOIN {criteria_table} pc ON p.criteria_id = pc.id "
+            f"INNER JOIN {criteria_table} cc ON cc.id = {point_table}.criteria_id "
+            f"INNER JOIN {group_table} g ON g.id = cc.group_id "
+            f"WHERE p.student_id = {point_table}.student_id "
+            f"AND p.activity_id = {point_table}.activity_id "
+            f"AND pc.group_id = cc.group_id "
+            f"GROUP BY g.max_score"
+            f") WHERE 1 = 1{where}"
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _update_total_scores(student_ids):
+    user_table = User._meta.db_table
+    score_table = StudentGroupScore._meta.db_table
+    where, params = _student_filter(f'{user_table}.id', student_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {user_table} SET total_score = COALESCE(("
+            f"SELECT SUM(s.capped_score) FROM {score_table} s WHERE s.student_id = {user_table}.id"
+            f"), 0) WHERE 1 = 1{where}",
+            params
+        )
+        return cursor.rowcount
+
+
+def recompute_scores(student_ids=None):
+    """Tính lại group_total_score, StudentGroupScore và User.total_score bằng vài câu SQL theo nhóm."""
+    with transaction.atomic():
+        points = _update_group_totals(student_ids)
+        rebuild_group_scores(student_ids)
+        if student_ids is None:
+            students = _update_total_scores(student_ids)
+            rollups.rebuild_rollups()
+        else:
+            # Chụp trạng thái trước/sau của lô để cập nhật rollup lớp/khoa theo phần chênh lệch
+            before = rollups.student_states(student_ids, lock=True)
+            students = _update_total_scores(student_ids)
+            rollups.record_changes(before, rollups.student_states(student_ids))
+        versions.bump_version(versions.SCORES)
+    return students, points
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    # Tiến trình con tạo bằng spawn cần khởi tạo lại Django
+    if not apps.ready:
+        django.setup()
+
+
+def _recompute_chunk(student_ids):
+    return recompute_scores(student_ids)
+
+
+def student_scope(class_id=None, department_id=None):
+    students = User.objects.all()
+    if class_id:
+        students = students.filter(student_class_id=class_id)
+    if department_id:
+        students = students.filter(Q(department_id=department_id) | Q(student_class__department_id=department_id))
+    return students
+
+
+def recompute_all(class_id=None, department_id=None, chunk_size=1000, workers=1, callback=None):
+    """Tính lại điểm theo từng lô sinh viên, mỗi lô một transaction; workers > 1 dùng process pool."""
+    started = time.perf_counter()
+    student_ids = list(student_scope(class_id, department_id).order_by('id').values_list('id', flat=True))
+    chunks = list(_chunks(student_ids, chunk_size))
+
+    totals = {'students': 0, 'points': 0, 'chunks': len(chunks)}
+
+    def collect(result):
+        students, points = result
+        totals['students'] += students
+        totals['points'] += points
+        if callback:
+            callback(totals['students'], totals['points'], time.perf_counter() - started)
+
+    if workers > 1 and len(chunks) > 1:
+        # Đóng kết nối trước khi fork để các tiến trình con không dùng chung socket
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for result in executor.map(_recompute_chunk, chunks):
+                collect(result)
+    else:
+        for chunk in chunks:
+            collect(recompute_scores(chunk))
+
+    elapsed = time.perf_counter() - started
+    totals['elapsed'] = elapsed
+    totals['students_per_second'] = totals['students'] / elapsed if elapsed else 0
+    totals['points_per_second'] = totals['points'] / elapsed if elapsed else 0
+    return totals
+
+
+_deferred = threading.local()
+
+
+def is_deferred():
+    return getattr(_deferred, 'depth', 0) > 0
+
+
+def mark_dirty(*student_ids):
+    _deferred.students.update(student_id for student_id in student_ids if student_id)
+
+
+def flush_deferred(chunk_size=1000):
+    """Tính lại điểm một lần cho mỗi sinh viên đã bị đánh dấu, rồi xoá danh sách."""
+    students = sorted(getattr(_deferred, 'students', ()))
+    if not students:
+        return 0
+    _deferred.students = set()
+
+    for chunk in _chunks(students, chunk_size):
+        recompute_scores(chunk)
+    return len(students)
+
+
+@contextmanager
+def deferred_recompute():
+    """Trong khối này DisciplinePoint.save/xoá điểm chỉ đánh dấu sinh viên; điểm được tính lại một lần khi thoát khối.
+
+    Dùng cho mọi chỗ ghi nhiều điểm liên tiếp (admin, API, script); AttendanceImporter ghi bằng bulk_create nên tự
+    gọi recompute_scores theo lô.
+    """
+    depth = getattr(_deferred, 'depth', 0)
+    if depth == 0:
+        _deferred.students = set()
+    _deferred.depth = depth + 1
+
+    try:
+        yield
+    except BaseException:
+        _deferred.depth = depth
+        if depth == 0:
+            _deferred.students = set()
+        raise
+    else:
+        _deferred.depth = depth
+        if depth == 0:
+            flush_deferred()
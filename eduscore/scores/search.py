@@ -0,0 +1,176 @@
+import html
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.utils.html import strip_tags
+
+from .models import Activity, ActivitySearchIndex
+
+INDEX_TABLE = ActivitySearchIndex._meta.db_table
+FTS_TABLE = f'{INDEX_TABLE}_fts'
+
+# Số kết quả tối đa được xếp hạng cho một truy vấn; vượt quá thì danh sách trả về có truncated = true
+SEARCH_LIMIT = 500
+
+# Danh sách stopword mặc định của InnoDB (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD). Từ trong danh sách này
+# hoặc ngắn hơn innodb_ft_min_token_size (mặc định 3) không có trong chỉ mục FULLTEXT, trong đó có nhiều âm tiết
+# tiếng Việt đã bỏ dấu (ha, he, le, an, la, de): các từ đó được lọc bằng LIKE thay vì MATCH
+MYSQL_STOPWORDS = frozenset([
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i', 'in', 'is',
+    'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will',
+    'with', 'und', 'www',
+])
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt (kể cả đ/Đ) để 'Hoạt Động' và 'hoat dong' khớp nhau."""
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokens(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+def plain_text(rich_text):
+    return html.unescape(strip_tags(rich_text or ''))
+
+
+def build_entry(activity_id, title, description, tag_names):
+    body = ' '.join([plain_text(description), *tag_names])
+    return ActivitySearchIndex(activity_id=activity_id, title=fold(title), body=fold(body))
+
+
+def index_activities(activity_ids=None, batch_size=1000):
+    """Ghi lại dòng chỉ mục của các hoạt động (None: tất cả) theo từng lô; trả về số dòng đã ghi."""
+    activities = Activity.objects.all()
+    entries = ActivitySearchIndex.objects.all()
+    if activity_ids is not None:
+        activity_ids = list(activity_ids)
+        activities = activities.filter(id__in=activity_ids)
+        entries = entries.filter(activity_id__in=activity_ids)
+    entries.delete()
+
+    rows = activities.order_by('id').values_list('id', 'title', 'description')
+    count, last_id = 0, 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return count
+
+        tags = {}
+        for activity_id, tag_name in Activity.tags.through.objects.filter(
+                activity_id__in=[row[0] for row in batch]).values_list('activity_id', 'tag__name'):
+            tags.setdefault(activity_id, []).append(tag_name)
+
+        ActivitySearchIndex.objects.bulk_create([
+            build_entry(activity_id, title, description, tags.get(activity_id, ()))
+            for activity_id, title, description in batch
+        ])
+        count += len(batch)
+        last_id = batch[-1][0]
+
+
+_backends = {}
+
+
+def backend():
+    """mysql (FULLTEXT), fts5 (SQLite có FTS5) hoặc like (icontains trên văn bản đã bỏ dấu)."""
+    if connection.alias not in _backends:
+        if connection.vendor == 'mysql':
+            _backends[connection.alias] = 'mysql'
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backends[connection.alias] = 'fts5'
+        else:
+            _backends[connection.alias] = 'like'
+    return _backends[connection.alias]
+
+
+_min_token_sizes = {}
+
+
+def mysql_min_token_size():
+    if connection.alias not in _min_token_sizes:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT @@innodb_ft_min_token_size")
+            _min_token_sizes[connection.alias] = cursor.fetchone()[0]
+    return _min_token_sizes[connection.alias]
+
+
+def mysql_terms(words, min_token_size):
+    """Chia các từ thành (từ có trong chỉ mục FULLTEXT, từ phải lọc bằng LIKE)."""
+    indexed = [word for word in words if len(word) >= min_token_size and word not in MYSQL_STOPWORDS]
+    return indexed, [word for word in words if word not in indexed]
+
+
+def _like_pattern(word):
+    # Từ chỉ gồm chữ, số và _, chỉ _ là ký tự đặc biệt của LIKE
+    return '%' + word.replace('_', '\\_') + '%'
+
+
+def _mysql_ids(words, limit):
+    indexed, unindexed = mysql_terms(words, mysql_min_token_size())
+    if not indexed:
+        return _like_ids(words, limit)
+
+    # Từ cuối khớp theo tiền tố nếu nó có trong chỉ mục; từ không có trong chỉ mục chỉ lọc trên các dòng đã khớp MATCH
+    boolean_query = ' '.join(f'+{word}*' if word == words[-1] else f'+{word}' for word in indexed)
+    natural_query = ' '.join(indexed)
+    like_sql = ''.join(" AND (title LIKE %s OR body LIKE %s)" for _ in unindexed)
+    like_params = [_like_pattern(word) for word in unindexed for _ in range(2)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT activity_id, MATCH(title, body) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score "
+            f"FROM {INDEX_TABLE} WHERE MATCH(title, body) AGAINST (%s IN BOOLEAN MODE){like_sql} "
+            f"ORDER BY score DESC LIMIT %s",
+            [natural_query, boolean_query, *like_params, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fts5_ids(words, limit):
+    # Tiêu đề được tính trọng số gấp 5 lần nội dung
+    match = ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 5.0, 1.0) LIMIT %s",
+            [match, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _like_ids(words, limit):
+    condition = Q()
+    for word in words:
+        condition &= Q(title__contains=word) | Q(body__contains=word)
+    title_hits = sum(Case(When(title__contains=word, then=1), default=0, output_field=IntegerField()) for word in words)
+    rows = ActivitySearchIndex.objects.filter(condition).annotate(title_hits=title_hits) \
+        .order_by('-title_hits', '-activity_id').values_list('activity_id', flat=True)
+    return list(rows[:limit])
+
+
+def search_activity_ids(query, limit=SEARCH_LIMIT):
+    """ID hoạt động khớp mọi từ trong query (từ cuối khớp theo tiền tố, không phân biệt dấu), sắp theo mức liên quan."""
+    words = tokens(query)
+    if not words:
+        return []
+    return {'mysql': _mysql_ids, 'fts5': _fts5_ids, 'like': _like_ids}[backend()](words, limit)
+
+
+def ranked_ids(queryset, activity_ids):
+    """Các id trong activity_ids còn thoả các bộ lọc khác của queryset, giữ nguyên thứ tự xếp hạng."""
+    if not activity_ids:
+        return []
+    allowed = set(queryset.filter(id__in=activity_ids).values_list('id', flat=True))
+    return [activity_id for activity_id in activity_ids if activity_id in allowed]
+
+
+def load_ranked(queryset, activity_ids):
+    """Nạp các hoạt động của một trang kết quả theo đúng thứ tự activity_ids."""
+    activities = {activity.id: activity for activity in queryset.filter(id__in=activity_ids)}
+    return [activities[activity_id] for activity_id in activity_ids if activity_id in activities]
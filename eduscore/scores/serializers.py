@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from .models import *
 from django.contrib.auth.password_validation import validate_password
 
@@ -37,6 +38,7 @@ class UserSerializer(BaseSerializer):
     class Meta:
         model = User
         fields = ['id', 'username','password', 'first_name', 'last_name','image','role','total_score']
+        read_only_fields = ['total_score']
         extra_kwargs = {
             'password': {
                 'write_only': True
@@ -162,4 +164,25 @@ class MessageSerializer(serializers.ModelSerializer):
 class ClassSerializer(serializers.ModelSerializer):
     class Meta:
         model = Class
-        fields = ['id', 'name', 'code', 'department']
\ No newline at end of file
+        fields = ['id', 'name', 'code', 'department']
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    errors = serializers.SerializerMethodField()
+    # File lỗi nằm trong bộ lưu trữ riêng, chỉ tải qua endpoint errors (cần quyền admin), không trả URL media
+    errors_url = serializers.SerializerMethodField()
+
+    def get_errors(self, job):
+        from scores.jobs import MAX_STORED_ERRORS
+
+        return job.errors[:MAX_STORED_ERRORS]
+
+    def get_errors_url(self, job):
+        if not job.error_file:
+            return None
+        return reverse('participation-import-errors', kwargs={'job_id': job.pk}, request=self.context.get('request'))
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'status', 'chunk_size', 'partial', 'checkpoint', 'processed_rows', 'unchanged_rows',
+                  'failed_rows', 'rows_per_second', 'errors', 'errors_url', 'failure_reason', 'created_date', 'started_at',
+                  'finished_at']
@@ -0,0 +1,165 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import registrations, rollups, scoring, search, versions
+from .models import Activity, Category, Class, Department, DisciplinePoint, EvaluationGroup, Registration, Tag, User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Đăng nhập chỉ cập nhật last_login, không ảnh hưởng dữ liệu điểm
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    versions.bump_version(versions.SCORES)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def score_data_changed(sender, **kwargs):
+    versions.bump_version(versions.SCORES)
+
+
+def _affects_rollups(update_fields):
+    return not update_fields or bool(set(update_fields) & {'total_score', 'student_class', 'department', 'role'})
+
+
+@receiver(pre_save, sender=User)
+def user_rollup_before(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and _affects_rollups(update_fields):
+        # Khoá dòng tới hết User.save: một delta F() (add_to_total_score) chen vào giữa pre_save và post_save
+        # sẽ bị tính hai lần
+        instance._rollup_state = rollups.student_states([instance.pk], lock=True)
+
+
+@receiver(post_save, sender=User)
+def user_rollup_after(sender, instance, update_fields=None, **kwargs):
+    if not _affects_rollups(update_fields):
+        return
+    before = getattr(instance, '_rollup_state', None) or {}
+    instance._rollup_state = None
+    # Trường không nằm trong update_fields (total_score khi lưu cả đối tượng) giữ giá trị trong DB, không lấy từ instance
+    saved = {field: getattr(instance, field) for field in rollups.STATE_FIELDS
+             if not update_fields or User._meta.get_field(field).name in update_fields}
+    rollups.record_changes(before, {instance.pk: {**before.get(instance.pk, {}), **saved}})
+
+
+@receiver(post_delete, sender=User)
+def user_rollup_deleted(sender, instance, **kwargs):
+    rollups.record_changes({instance.pk: {field: getattr(instance, field) for field in rollups.STATE_FIELDS}}, {})
+
+
+def _deleted_from(origin, model):
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(post_delete, sender=DisciplinePoint)
+def discipline_point_deleted(sender, instance, origin=None, **kwargs):
+    # Dùng signal thay vì DisciplinePoint.delete(): xoá theo queryset và xoá cascade từ Activity,
+    # EvaluationCriteria, EvaluationGroup cũng phải trừ điểm. Điểm con bị xoá trước dòng cha nên tiêu chí/nhóm vẫn còn.
+    if _deleted_from(origin, User):
+        # Sinh viên bị xoá cùng toàn bộ điểm, rollup đã được trừ theo dòng User
+        return
+    if _deleted_from(origin, EvaluationGroup):
+        # StudentGroupScore của nhóm bị xoá cùng lúc, điểm được tính lại một lần trong evaluation_group_deleted
+        return
+    if scoring.is_deferred():
+        scoring.mark_dirty(instance.student_id)
+        return
+    group = EvaluationGroup.objects.filter(evaluationcriteria=instance.criteria_id).values('id', 'max_score').first()
+    if group is not None:
+        with transaction.atomic(savepoint=False):
+            instance.apply_score_delta(instance.student_id, group['id'], group['max_score'], -instance.score)
+
+
+@receiver(pre_delete, sender=EvaluationGroup)
+def evaluation_group_deleting(sender, instance, **kwargs):
+    instance._score_student_ids = list(
+        DisciplinePoint.objects.filter(criteria__group=instance).order_by().values_list('student_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=EvaluationGroup)
+def evaluation_group_deleted(sender, instance, **kwargs):
+    student_ids = getattr(instance, '_score_student_ids', None)
+    if student_ids:
+        scoring.recompute_scores(student_ids)
+
+
+@receiver(post_delete, sender=Class)
+@receiver(post_delete, sender=Department)
+def rollup_group_deleted(sender, **kwargs):
+    # Sinh viên của lớp/khoa bị xoá chuyển sang nhóm rỗng (SET_NULL không phát signal), tính lại toàn bộ
+    rollups.rebuild_rollups()
+
+
+@receiver(post_save, sender=Activity)
+def activity_search_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_activities([instance.pk])
+
+
+@receiver(m2m_changed, sender=Activity.tags.through)
+def activity_search_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # tag.activity_set.clear() không kèm pk_set: ghi nhớ các hoạt động trước khi xoá liên kết
+        instance._search_activity_ids = list(instance.activity_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            search.index_activities([instance.pk])
+        elif action == 'post_clear':
+            search.index_activities(getattr(instance, '_search_activity_ids', ()))
+        else:
+            search.index_activities(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def tag_search_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_activities(instance.activity_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_search_deleting(sender, instance, **kwargs):
+    instance._search_activity_ids = list(instance.activity_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_search_deleted(sender, instance, **kwargs):
+    search.index_activities(getattr(instance, '_search_activity_ids', ()))
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def activity_data_changed(sender, raw=False, **kwargs):
+    if not raw:
+        versions.bump_version(versions.ACTIVITIES)
+
+
+@receiver(m2m_changed, sender=Activity.tags.through)
+def activity_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        versions.bump_version(versions.ACTIVITIES)
+
+
+@receiver(post_delete, sender=Registration)
+def registration_deleted(sender, instance, **kwargs):
+    # Mọi cách xoá (cancel, admin, xoá sinh viên) đều trả chỗ và xếp người đầu hàng chờ, để không ai chen ngang
+    if instance.active:
+        registrations.release_seats(instance.activity_id)
+        transaction.on_commit(lambda: registrations.promote(instance.activity_id))
+
+
+@receiver(post_save, sender=Activity)
+def activity_capacity_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Sức chứa có thể đã tăng: xếp chỗ cho hàng chờ sau khi commit
+    if not created and not raw and (not update_fields or 'capacity' in update_fields):
+        transaction.on_commit(lambda: registrations.promote(instance.pk))
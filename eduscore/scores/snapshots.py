@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClassScoreRollup, ClassScoreSnapshot, StudentScoreSnapshot, User
+from .stats import summarize
+
+SNAPSHOT_BATCH_SIZE = 2000
+DEFAULT_TREND_DAYS = 90
+
+
+def _student_snapshots(date, batch_size):
+    students = User.objects.filter(role='student').order_by('id').values_list('id', 'total_score')
+    for student_id, total_score in students.iterator(chunk_size=batch_size):
+        yield StudentScoreSnapshot(date=date, student_id=student_id, total_score=total_score)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@transaction.atomic
+def take_snapshot(date=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Ghi ảnh chụp điểm theo lớp (từ bảng rollup) và theo sinh viên cho một ngày; chạy lại sẽ ghi đè ngày đó."""
+    date = date or timezone.localdate()
+
+    ClassScoreSnapshot.objects.filter(date=date).delete()
+    StudentScoreSnapshot.objects.filter(date=date).delete()
+
+    classes = []
+    rollups = ClassScoreRollup.objects.filter(student_class__isnull=False, student_count__gt=0)
+    for row in rollups.values('student_class_id', 'student_count', 'score_sum', 'score_sum_squares'):
+        summary = summarize(row)
+        classes.append(ClassScoreSnapshot(
+            date=date, student_class_id=row['student_class_id'], student_count=summary['student_count'],
+            avg_score=summary['avg_score'], std_score=summary['std_score'],
+        ))
+    ClassScoreSnapshot.objects.bulk_create(classes, batch_size=batch_size)
+
+    students = 0
+    for batch in _batches(_student_snapshots(date, batch_size), batch_size):
+        StudentScoreSnapshot.objects.bulk_create(batch)
+        students += len(batch)
+
+    return len(classes), students
+
+
+def class_trend(start, end, class_id=None):
+    """Chuỗi điểm trung bình theo ngày của từng lớp trong khoảng [start, end]."""
+    rows = ClassScoreSnapshot.objects.filter(date__range=(start, end))
+    if class_id:
+        rows = rows.filter(student_class_id=class_id)
+    rows = rows.order_by('student_class__name', 'student_class_id', 'date').values_list(
+        'student_class_id', 'student_class__name', 'date', 'student_count', 'avg_score', 'std_score'
+    )
+
+    series = []
+    for class_pk, name, date, student_count, avg_score, std_score in rows:
+        if not series or series[-1]['class_id'] != class_pk:
+            series.append({'class_id': class_pk, 'student_class__name': name, 'points': []})
+        series[-1]['points'].append({
+            'date': date, 'student_count': student_count, 'avg_score': avg_score, 'std_score': std_score,
+        })
+    return series
+
+
+def student_trend(student_id, start, end):
+    rows = StudentScoreSnapshot.objects.filter(student_id=student_id, date__range=(start, end)).order_by('date')
+    return [{'date': date, 'total_score': total_score} for date, total_score in rows.values_list('date', 'total_score')]
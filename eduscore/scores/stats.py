@@ -0,0 +1,304 @@
+import bisect
+import itertools
+import math
+import time
+
+import numpy
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q
+
+from . import rollups, versions
+from .models import ClassScoreRollup, DepartmentScoreRollup, DisciplinePoint, EvaluationGroup, Participation, User
+
+# Kết quả gắn với version điểm nên chỉ cần hết hạn để dọn cache, không phải để làm mới dữ liệu
+STATS_CACHE_TIMEOUT = 60 * 60
+
+
+def summarize(row):
+    count, score_sum = row['student_count'], row['score_sum']
+    mean = score_sum / count if count > 0 else 0
+    variance = row['score_sum_squares'] / count - mean * mean if count > 0 else 0
+    return {
+        'total_score': score_sum,
+        'student_count': count,
+        'avg_score': round(mean, 2),
+        'std_score': round(math.sqrt(max(variance, 0)), 2),
+    }
+
+
+def compute_class_stats(class_id=None):
+    """Tổng điểm, số sinh viên, điểm trung bình và phân loại theo lớp, đọc từ bảng rollup (mỗi lớp một dòng)."""
+    rows = ClassScoreRollup.objects.filter(student_count__gt=0)
+    if class_id:
+        rows = rows.filter(student_class_id=class_id)
+    rows = rows.order_by('student_class__name').values(
+        'student_class__name', 'student_count', 'score_sum', 'score_sum_squares', *rollups.BUCKET_FIELDS
+    )
+
+    stats_by_class, classification = [], []
+    for row in rows:
+        name = row['student_class__name']
+        stats_by_class.append({'student_class__name': name, **summarize(row)})
+        classification.append({'student_class__name': name, **{bucket: row[bucket] for bucket in rollups.BUCKET_FIELDS}})
+
+    result = {'stats_by_class': stats_by_class, 'classification': classification}
+    if not class_id:
+        departments = DepartmentScoreRollup.objects.filter(student_count__gt=0).order_by('department__name').values(
+            'department__name', 'student_count', 'score_sum', 'score_sum_squares', *rollups.BUCKET_FIELDS
+        )
+        result['stats_by_department'] = [
+            {'department__name': row['department__name'], **summarize(row),
+             **{bucket: row[bucket] for bucket in rollups.BUCKET_FIELDS}}
+            for row in departments
+        ]
+    return result
+
+
+def class_stats(class_id=None):
+    """Như compute_class_stats nhưng đọc từ cache; khoá gồm version điểm nên tự mất hiệu lực khi điểm thay đổi."""
+    version, _ = versions.get_version(versions.SCORES)
+    key = f'score-stats:{version}:{class_id or "all"}'
+
+    result = cache.get(key)
+    if result is None:
+        result = compute_class_stats(class_id)
+        cache.set(key, result, STATS_CACHE_TIMEOUT)
+    return result
+
+
+# (khoá nhóm, tên hiển thị): nhóm theo id vì tên lớp có thể trùng giữa các khoa
+DISTRIBUTION_GROUPS = {
+    'class': ('student_class_id', 'student_class__name'),
+    'department': ('department_id', 'department__name'),
+}
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+MAX_BINS = 100
+
+
+def _describe(scores, edges, percentiles):
+    if not len(scores):
+        return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None,
+                'percentiles': {f'p{p:g}': None for p in percentiles}, 'histogram': [0] * (len(edges) - 1)}
+
+    values = numpy.percentile(scores, percentiles)
+    return {
+        'count': int(len(scores)),
+        'mean': round(float(scores.mean()), 2),
+        'std': round(float(scores.std()), 2),
+        'min': float(scores.min()),
+        'max': float(scores.max()),
+        'percentiles': {f'p{p:g}': round(float(v), 2) for p, v in zip(percentiles, values)},
+        'histogram': numpy.histogram(scores, bins=edges)[0].tolist(),
+    }
+
+
+def compute_distribution(group_by='class', bins=10, percentiles=DEFAULT_PERCENTILES):
+    """Phân phối điểm theo lớp/khoa: trung bình, độ lệch chuẩn, phân vị và histogram, tính bằng NumPy.
+
+    Mọi nhóm dùng chung các mốc histogram (mặc định từ 0 tới 100, nới ra nếu có điểm nằm ngoài) để so sánh được với nhau.
+    """
+    key_field, name_field = DISTRIBUTION_GROUPS[group_by]
+    rows = (
+        User.objects.filter(**{f'{key_field}__isnull': False})
+        .order_by(name_field, key_field)
+        .values_list(key_field, name_field, 'total_score')
+    )
+    keys, names, scores = zip(*rows) if rows else ((), (), ())
+    scores = numpy.fromiter(scores, dtype=float, count=len(scores))
+
+    lower = min(0.0, float(scores.min())) if len(scores) else 0.0
+    upper = max(100.0, float(scores.max())) if len(scores) else 100.0
+    edges = numpy.linspace(lower, upper, bins + 1)
+
+    groups = []
+    start = 0
+    for (key, name), members in itertools.groupby(zip(keys, names)):
+        end = start + sum(1 for _ in members)
+        groups.append({'id': key, 'name': name, **_describe(scores[start:end], edges, percentiles)})
+        start = end
+
+    return {
+        'group_by': group_by,
+        'bin_edges': [round(float(edge), 2) for edge in edges],
+        'overall': _describe(scores, edges, percentiles),
+        'groups': groups,
+    }
+
+
+def distribution(group_by='class', bins=10, percentiles=DEFAULT_PERCENTILES):
+    version, _ = versions.get_version(versions.SCORES)
+    key = f'score-distribution:{version}:{group_by}:{bins}:{",".join(f"{p:g}" for p in percentiles)}'
+
+    result = cache.get(key)
+    if result is None:
+        result = compute_distribution(group_by, bins, percentiles)
+        cache.set(key, result, STATS_CACHE_TIMEOUT)
+    return result
+
+
+LEADERBOARD_CACHE_TIMEOUT = 30
+DEFAULT_LEADERBOARD_SIZE = 50
+MAX_LEADERBOARD_SIZE = 100
+
+
+def compute_leaderboard(class_id=None, department_id=None, limit=DEFAULT_LEADERBOARD_SIZE):
+    """Top-N sinh viên theo total_score trong lớp, khoa hoặc toàn trường; điểm bằng nhau thì cùng hạng."""
+    students = User.objects.filter(role='student')
+    if class_id:
+        students = students.filter(student_class_id=class_id)
+    elif department_id:
+        students = students.filter(department_id=department_id)
+    students = students.order_by('-total_score', 'id').values(
+        'id', 'username', 'first_name', 'last_name', 'total_score', 'student_class__name'
+    )[:limit]
+
+    leaderboard = []
+    for position, student in enumerate(students, start=1):
+        if leaderboard and leaderboard[-1]['total_score'] == student['total_score']:
+            rank = leaderboard[-1]['rank']
+        else:
+            rank = position
+        leaderboard.append({'rank': rank, **student})
+    return leaderboard
+
+
+def leaderboard(class_id=None, department_id=None, limit=DEFAULT_LEADERBOARD_SIZE):
+    # TTL ngắn cộng với version điểm: điểm đổi là cache mất hiệu lực ngay
+    version, _ = versions.get_version(versions.SCORES)
+    key = f'leaderboard:{version}:{class_id or ""}:{department_id or ""}:{limit}'
+
+    result = cache.get(key)
+    if result is None:
+        result = compute_leaderboard(class_id, department_id, limit)
+        cache.set(key, result, LEADERBOARD_CACHE_TIMEOUT)
+    return result
+
+
+RANK_SCOPES = {
+    'class': 'student_class_id',
+    'department': 'department_id',
+    'school': None,
+}
+RANK_GENERATION_KEY = 'score-ranks-generation'
+
+
+def _rank_generation():
+    # Đổi generation là bỏ mọi danh sách cùng lúc (sau khi tính lại toàn bộ điểm); lấy theo thời gian để
+    # khoá bị đẩy khỏi cache cũng không quay về một số đã dùng
+    return cache.get_or_set(RANK_GENERATION_KEY, time.time_ns, None)
+
+
+def _rank_cache_key(generation, scope, key=None):
+    return f'score-ranks:{generation}:{scope}:{"" if key is None else key}'
+
+
+def _load_sorted_scores(scope, key=None):
+    students = User.objects.filter(role='student')
+    if RANK_SCOPES[scope]:
+        students = students.filter(**{RANK_SCOPES[scope]: key})
+    return list(students.order_by('total_score').values_list('total_score', flat=True))
+
+
+def rank_in(scores, score):
+    """Hạng (số người điểm cao hơn + 1) và phần trăm số người có điểm không cao hơn, tìm nhị phân O(log n)."""
+    total = len(scores)
+    if not total:
+        return {'rank': None, 'total': 0, 'percentile': None}
+    at_or_below = bisect.bisect_right(scores, score)
+    return {
+        'rank': total - at_or_below + 1,
+        'total': total,
+        'percentile': round(100 * at_or_below / total, 1),
+    }
+
+
+def student_rank(student):
+    """Hạng của sinh viên trong lớp, khoa và toàn trường.
+
+    Danh sách total_score (tăng dần) của từng phạm vi nằm trong cache, riêng cho từng lớp/khoa và chỉ bị bỏ khi
+    điểm trong phạm vi đó thay đổi (forget_ranks), nên khi cache còn thì không có truy vấn SQL nào.
+    """
+    scopes = {}
+    for scope, field in RANK_SCOPES.items():
+        key = getattr(student, field) if field else None
+        if not field or key is not None:
+            scopes[scope] = key
+
+    generation = _rank_generation()
+    keys = {scope: _rank_cache_key(generation, scope, key) for scope, key in scopes.items()}
+    cached = cache.get_many(keys.values())
+
+    result, missing = {'total_score': student.total_score}, {}
+    for scope in RANK_SCOPES:
+        if scope not in scopes:
+            result[scope] = None
+            continue
+        scores = cached.get(keys[scope])
+        if scores is None:
+            scores = missing[keys[scope]] = _load_sorted_scores(scope, scopes[scope])
+        result[scope] = rank_in(scores, student.total_score)
+
+    if missing:
+        cache.set_many(missing, STATS_CACHE_TIMEOUT)
+    return result
+
+
+def forget_ranks(class_ids=(), department_ids=()):
+    """Bỏ danh sách điểm đã cache của các lớp/khoa (và toàn trường) có điểm thay đổi, sau khi transaction commit."""
+    class_ids = {key for key in class_ids if key is not None}
+    department_ids = {key for key in department_ids if key is not None}
+
+    def forget():
+        generation = _rank_generation()
+        cache.delete_many([
+            _rank_cache_key(generation, 'school'),
+            *(_rank_cache_key(generation, 'class', key) for key in class_ids),
+            *(_rank_cache_key(generation, 'department', key) for key in department_ids),
+        ])
+
+    transaction.on_commit(forget)
+
+
+def forget_all_ranks():
+    transaction.on_commit(lambda: cache.set(RANK_GENERATION_KEY, time.time_ns(), None))
+
+
+DEFAULT_RECENT_POINTS = 10
+MAX_RECENT_POINTS = 50
+
+
+def student_dashboard(student_id, recent=DEFAULT_RECENT_POINTS):
+    """Tổng điểm, điểm theo nhóm tiêu chí, điểm gần đây và số hoạt động đã tham gia: cố định 4 truy vấn."""
+    student = User.objects.filter(pk=student_id).values(
+        'id', 'username', 'first_name', 'last_name', 'total_score', 'student_class__name', 'department__name'
+    ).first()
+
+    groups = (
+        EvaluationGroup.objects
+        .annotate(mine=FilteredRelation('studentgroupscore', condition=Q(studentgroupscore__student_id=student_id)))
+        .order_by('id')
+        .values('id', 'name', 'max_score', 'mine__raw_score', 'mine__capped_score')
+    )
+
+    points = (
+        DisciplinePoint.objects.filter(student_id=student_id)
+        .order_by('-created_date', '-id')
+        .values('id', 'activity_id', 'activity__title', 'criteria__name', 'criteria__group__name', 'score',
+                'created_date')[:recent]
+    )
+
+    participation = Participation.objects.filter(student_id=student_id, active=True).aggregate(
+        total=Count('id'), completed=Count('id', filter=Q(is_completed=True))
+    )
+
+    return {
+        **student,
+        'groups': [
+            {'id': group['id'], 'name': group['name'], 'max_score': group['max_score'],
+             'raw_score': group['mine__raw_score'] or 0, 'capped_score': group['mine__capped_score'] or 0}
+            for group in groups
+        ],
+        'recent_points': list(points),
+        'participation': participation,
+    }
@@ -1,3 +1,1254 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import FileResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from scores import exports, imports, jobs, listings, registrations, rollups, scoring, search, snapshots, stats, versions
+from scores.imports import AttendanceImporter
+from scores.models import (Activity, Category, Class, ClassScoreRollup, Department, DepartmentScoreRollup,
+                           DisciplinePoint, EvaluationCriteria, EvaluationGroup, ImportJob, Participation, Registration,
+                           StudentGroupScore, StudentScoreSnapshot, Tag, User, WaitlistEntry)
+
+
+class ScoreUpkeepTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+        self.students = [User.objects.create(username=f'student{i}') for i in range(2)]
+        self.groups = [
+            EvaluationGroup.objects.create(name='Ý thức học tập', max_score=10),
+            EvaluationGroup.objects.create(name='Hoạt động xã hội', max_score=20),
+        ]
+        self.activities = [
+            Activity.objects.create(title=f'Hoạt động {i}', description='', start_date=datetime.date(2025, 1, 1),
+                                    end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                    category=category)
+            for i in range(2)
+        ]
+        self.criteria = [
+            EvaluationCriteria.objects.create(group=self.groups[0], name='Tham gia', score=4),
+            EvaluationCriteria.objects.create(group=self.groups[1], name='Tổ chức', score=4),
+        ]
+
+    def add_point(self, student=0, activity=0, criteria=0, score=4):
+        point = DisciplinePoint(student=self.students[student], activity=self.activities[activity],
+                                criteria=self.criteria[criteria], score=score)
+        point.save()
+        return point
+
+    def assertScoresConsistent(self):
+        # So sánh số đã lưu với kết quả tính lại từ đầu bằng DisciplinePoint
+        for student in User.objects.filter(pk__in=[student.pk for student in self.students]):
+            expected_total = 0
+            for group in EvaluationGroup.objects.all():
+                raw = sum(DisciplinePoint.objects.filter(student=student, criteria__group=group)
+                          .values_list('score', flat=True))
+                expected_total += min(raw, group.max_score)
+                stored = StudentGroupScore.objects.filter(student=student, group=group).first()
+                self.assertEqual(stored.raw_score if stored else 0, raw, (student.username, group.name))
+                self.assertEqual(stored.capped_score if stored else 0, min(raw, group.max_score))
+            self.assertEqual(student.total_score, expected_total, student.username)
+
+    def test_create_caps_group_score(self):
+        for _ in range(3):
+            self.add_point(score=4)
+        self.add_point(criteria=1, score=5)
+
+        self.assertScoresConsistent()
+        self.students[0].refresh_from_db()
+        self.assertEqual(self.students[0].total_score, 15)
+
+    def test_update_score(self):
+        point = self.add_point(score=4)
+        point.score = 9
+        point.save()
+        self.assertScoresConsistent()
+
+    def test_move_point_to_other_group(self):
+        point = self.add_point(score=8)
+        point.criteria = self.criteria[1]
+        point.save()
+        self.assertScoresConsistent()
+
+    def test_move_point_to_other_student(self):
+        point = self.add_point(score=8)
+        point.student = self.students[1]
+        point.save()
+        self.assertScoresConsistent()
+
+    def test_delete_instance_and_queryset(self):
+        point = self.add_point(score=8)
+        self.add_point(criteria=1, score=6)
+        self.add_point(student=1, score=3)
+
+        point.delete()
+        self.assertScoresConsistent()
+
+        DisciplinePoint.objects.filter(criteria=self.criteria[1]).delete()
+        self.assertScoresConsistent()
+
+    def test_cascade_delete_from_activity_and_criteria(self):
+        for activity in range(2):
+            for criteria in range(2):
+                self.add_point(activity=activity, criteria=criteria, score=4)
+
+        self.activities[0].delete()
+        self.assertScoresConsistent()
+        self.add_point(activity=1, score=2)
+        self.assertScoresConsistent()
+
+        self.criteria[1].delete()
+        self.assertScoresConsistent()
+
+    def test_cascade_delete_from_group(self):
+        self.add_point(score=8)
+        self.add_point(criteria=1, score=6)
+
+        self.groups[1].delete()
+        self.assertScoresConsistent()
+
+    def test_deferred_recompute_coalesces_edits(self):
+        def edit(count):
+            with CaptureQueriesContext(connection) as queries, scoring.deferred_recompute():
+                points = [self.add_point(student=i % 2, activity=i % 2, criteria=i % 2, score=3) for i in range(count)]
+                for point in points[::2]:
+                    point.score = 1
+                    point.save()
+                DisciplinePoint.objects.filter(pk__in=[point.pk for point in points[1::4]]).delete()
+            return queries
+
+        small, large = edit(8), edit(16)
+        self.assertScoresConsistent()
+        # Phần tính lại điểm chạy một lần cho cả khối; mỗi lần ghi thêm chỉ có câu lệnh của chính nó
+        # (thêm: SAVEPOINT, INSERT, RELEASE; sửa: thêm SELECT student_id cũ), không phụ thuộc số nhóm tiêu chí
+        recomputes = [query for query in large if query['sql'].startswith(f'UPDATE {User._meta.db_table} SET total_score')]
+        self.assertEqual(len(recomputes), 1)
+        self.assertLessEqual(len(large) - len(small), 8 * 3 + 4 * 4)
+
+    def test_stale_user_save_keeps_total_score(self):
+        stale = User.objects.get(pk=self.students[0].pk)
+        self.add_point(score=8)
+
+        stale.first_name = 'An'
+        stale.save()
+
+        student = User.objects.get(pk=stale.pk)
+        self.assertEqual((student.first_name, student.total_score), ('An', 8))
+        self.assertScoresConsistent()
+        rollup = ClassScoreRollup.objects.get(student_class=None)
+        self.assertEqual(rollup.score_sum, sum(User.objects.values_list('total_score', flat=True)))
+
+    def test_concurrent_first_write_adds_to_existing_row(self):
+        self.add_point(score=3)
+        select_for_update = StudentGroupScore.objects.select_for_update
+        reads = []
+
+        def racing_select_for_update():
+            reads.append(1)
+            if len(reads) > 1:
+                return select_for_update()
+            # Lần đọc đầu chưa thấy dòng mà một giao dịch khác commit ngay trước lệnh INSERT của mình
+            return StudentGroupScore.objects.none()
+
+        with mock.patch.object(StudentGroupScore.objects, 'select_for_update', racing_select_for_update):
+            self.add_point(activity=1, score=4)
+
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(StudentGroupScore.objects.get().raw_score, 7)
+        self.assertScoresConsistent()
+
+
+class StudentDashboardTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(name='Công nghệ thông tin', code='IT')
+        student_class = Class.objects.create(name='IT01', code='IT01', department=department)
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+
+        self.student = User.objects.create(username='student', student_class=student_class, department=department)
+        self.groups = [
+            EvaluationGroup.objects.create(name='Ý thức học tập', max_score=20),
+            EvaluationGroup.objects.create(name='Hoạt động xã hội', max_score=10),
+        ]
+        self.activities = [
+            Activity.objects.create(title=f'Hoạt động {i}', description='', start_date=datetime.date(2025, 1, 1),
+                                    end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                    category=category)
+            for i in range(3)
+        ]
+        self.criteria = EvaluationCriteria.objects.create(group=self.groups[0], name='Tham gia', score=5)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def add_points(self, count):
+        for i in range(count):
+            activity = self.activities[i % len(self.activities)]
+            DisciplinePoint(student=self.student, activity=activity, criteria=self.criteria, score=6).save()
+            Participation.objects.get_or_create(student=self.student, activity=activity,
+                                                defaults={'is_completed': i % 2 == 0})
+
+    def test_dashboard_breakdown(self):
+        self.add_points(4)
+
+        response = self.client.get('/users/dashboard/', {'recent': 3})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_score'], 20)
+        self.assertEqual(data['student_class__name'], 'IT01')
+        self.assertEqual(
+            [(group['name'], group['raw_score'], group['capped_score']) for group in data['groups']],
+            [('Ý thức học tập', 24, 20), ('Hoạt động xã hội', 0, 0)]
+        )
+        self.assertEqual(len(data['recent_points']), 3)
+        self.assertEqual(data['participation'], {'total': 3, 'completed': 2})
+
+    def test_dashboard_query_count_is_fixed(self):
+        self.add_points(1)
+        with self.assertNumQueries(4):
+            self.client.get('/users/dashboard/')
+
+        self.add_points(12)
+        with self.assertNumQueries(4):
+            self.client.get('/users/dashboard/', {'recent': 50})
+
+    def test_dashboard_rejects_invalid_recent(self):
+        self.assertEqual(self.client.get('/users/dashboard/', {'recent': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/users/dashboard/', {'recent': 'x'}).status_code, 400)
+
+
+class RegistrationCapacityTests(TransactionTestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        self.activity = Activity.objects.create(title='Hiến máu', description='', start_date=datetime.date(2025, 1, 1),
+                                                end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=5,
+                                                category=Category.objects.create(name='Tình nguyện'))
+        self.students = [User.objects.create(username=f'student{i}') for i in range(20)]
+
+    def test_threads_racing_for_last_seats(self):
+        Registration.objects.create(student=self.students[0], activity=self.activity)
+        Activity.objects.filter(pk=self.activity.pk).update(registered_count=1)
+
+        barrier = threading.Barrier(len(self.students) - 1)
+        results = []
+
+        def register(student):
+            try:
+                barrier.wait()
+                registrations.register(student, self.activity)
+                results.append('registered')
+            except registrations.ActivityFull:
+                results.append('full')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(student,)) for student in self.students[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.activity.refresh_from_db()
+        self.assertEqual(results.count('registered'), 4)
+        self.assertEqual(results.count('full'), 15)
+        self.assertEqual(self.activity.registered_count, 5)
+        self.assertEqual(Registration.objects.filter(activity=self.activity).count(), 5)
+
+    def test_full_activity_returns_conflict_and_joins_waitlist(self):
+        Activity.objects.filter(pk=self.activity.pk).update(registered_count=5)
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/registration/', {'activity': self.activity.pk})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'waitlisted')
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('INSERT') and Registration._meta.db_table in query['sql']])
+        self.assertFalse(Registration.objects.exists())
+        self.assertEqual(WaitlistEntry.objects.count(), 1)
+
+    def test_duplicate_registration_releases_seat(self):
+        registrations.register(self.students[0], self.activity)
+        with self.assertRaises(registrations.AlreadyRegistered):
+            registrations.register(self.students[0], self.activity)
+
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.registered_count, 1)
+
+        Registration.objects.get().delete()
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.registered_count, 0)
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        self.activity = Activity.objects.create(title='Mùa hè xanh', description='', start_date=datetime.date(2025, 1, 1),
+                                                end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=2,
+                                                category=Category.objects.create(name='Tình nguyện'))
+        self.students = [User.objects.create(username=f'student{i}') for i in range(6)]
+        self.clients = []
+        for student in self.students:
+            client = APIClient()
+            client.force_authenticate(student)
+            self.clients.append(client)
+
+    def register(self, index):
+        return self.clients[index].post('/registration/', {'activity': self.activity.pk})
+
+    def status(self, index):
+        return self.clients[index].get('/registration/status/', {'activity_id': self.activity.pk}).json()
+
+    def test_fifo_positions_and_single_entry_per_student(self):
+        for index in range(5):
+            self.register(index)
+        self.register(3)
+
+        self.assertEqual([self.status(index)['status'] for index in range(6)],
+                         ['registered', 'registered', 'waitlisted', 'waitlisted', 'waitlisted', 'none'])
+        self.assertEqual([self.status(index)['position'] for index in (2, 3, 4)], [1, 2, 3])
+        self.assertEqual(WaitlistEntry.objects.count(), 3)
+
+    def test_cancel_promotes_next_in_line(self):
+        for index in range(4):
+            self.register(index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.clients[0].post('/registration/cancel/', {'activity': self.activity.pk})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.status(0)['status'], 'none')
+        self.assertEqual(self.status(2)['status'], 'registered')
+        self.assertEqual(self.status(3), {'activity': self.activity.pk, 'status': 'waitlisted', 'position': 1})
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.registered_count, 2)
+
+    def test_capacity_increase_promotes_in_bulk(self):
+        for index in range(6):
+            self.register(index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.activity.capacity = 5
+            self.activity.save()
+
+        self.assertEqual(list(Registration.objects.order_by('student_id').values_list('student_id', flat=True)),
+                         [student.id for student in self.students[:5]])
+        self.assertEqual(self.status(5)['position'], 1)
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.registered_count, 5)
+
+    def test_waitlisted_student_can_leave_queue(self):
+        for index in range(3):
+            self.register(index)
+
+        self.assertEqual(self.clients[2].post('/registration/cancel/', {'activity': self.activity.pk}).status_code, 204)
+        self.assertEqual(self.status(2)['status'], 'none')
+        self.assertEqual(self.clients[2].post('/registration/cancel/', {'activity': self.activity.pk}).status_code, 404)
+
+    def test_deleting_registration_elsewhere_promotes(self):
+        for index in range(3):
+            self.register(index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].delete()
+
+        self.assertEqual(self.status(2)['status'], 'registered')
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.registered_count, 2)
+
+    def test_admin_change_moves_seat(self):
+        other = Activity.objects.create(title='Tiếp sức mùa thi', description='', start_date=datetime.date(2025, 1, 1),
+                                        end_date=datetime.date(2025, 1, 2), created_by=self.activity.created_by,
+                                        capacity=2, category=self.activity.category)
+        for index in range(3):
+            self.register(index)
+        moved, toggled = (Registration.objects.get(student=self.students[index]) for index in (0, 1))
+
+        client = self.client_class()
+        client.force_login(self.activity.created_by)
+
+        def change(registration, activity, active):
+            data = {'student': registration.student_id, 'activity': activity.pk}
+            if active:
+                data['active'] = 'on'
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(f'/admin/scores/registration/{registration.pk}/change/', data)
+            self.assertEqual(response.status_code, 302)
+
+        def counts():
+            result = []
+            for activity in (self.activity, other):
+                activity.refresh_from_db()
+                self.assertEqual(activity.registered_count,
+                                 Registration.objects.filter(activity=activity, active=True).count())
+                result.append(activity.registered_count)
+            return result
+
+        # Chuyển sang hoạt động khác: chỗ cũ được nhường cho người đầu hàng chờ
+        change(moved, other, True)
+        self.assertEqual(counts(), [2, 1])
+        self.assertEqual(self.status(2)['status'], 'registered')
+
+        change(toggled, self.activity, False)
+        self.assertEqual(counts(), [1, 1])
+        change(toggled, self.activity, True)
+        self.assertEqual(counts(), [2, 1])
+
+        # Lưu lại không đổi gì thì không cộng thêm chỗ
+        change(moved, other, True)
+        self.assertEqual(counts(), [2, 1])
+
+
+class FeedPaginatorTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+        for i in range(7):
+            Activity.objects.create(title=f'Hoạt động {i}', description='', start_date=datetime.date(2025, 1, 1),
+                                    end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                    category=category)
+        # Trùng created_date để cursor phải dùng id phân định thứ tự
+        Activity.objects.filter(id__lte=Activity.objects.order_by('id')[3].id).update(
+            created_date=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc))
+        self.expected_ids = list(Activity.objects.order_by('-created_date', '-id').values_list('id', flat=True))
+
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_page_number_mode_is_default(self):
+        data = self.client.get('/activities/').json()
+        self.assertEqual(data['count'], 7)
+        self.assertEqual(len(data['results']), 2)
+
+    def test_cursor_round_trip(self):
+        seen, pages = [], 0
+        url = '/activities/?cursor=&page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            self.assertIsNone(data['previous'])
+            seen += [activity['id'] for activity in data['results']]
+            url = data['next']
+            pages += 1
+
+        self.assertEqual(seen, self.expected_ids)
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        for cursor in ('zzz', 'bm90LWEtY3Vyc29y', '!'):
+            self.assertEqual(self.client.get('/activities/', {'cursor': cursor}).status_code, 404, cursor)
+
+    def test_count_free_links(self):
+        first = self.client.get('/activities/', {'count': 0, 'page_size': 3}).json()
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+        self.assertIn('page=2', first['next'])
+
+        second = self.client.get(first['next']).json()
+        self.assertNotIn('page=', second['previous'])
+        self.assertIn('page=3', second['next'])
+
+        last = self.client.get(second['next']).json()
+        self.assertIsNone(last['next'])
+        self.assertIn('page=2', last['previous'])
+        self.assertEqual([activity['id'] for activity in first['results'] + second['results'] + last['results']],
+                         self.expected_ids)
+
+        self.assertEqual(self.client.get('/activities/', {'count': 0, 'page': 0}).status_code, 404)
+
+    def test_page_size_is_capped(self):
+        for i in range(7, 110):
+            Activity.objects.create(title=f'Hoạt động {i}', description='', start_date=datetime.date(2025, 1, 1),
+                                    end_date=datetime.date(2025, 1, 2), created_by=User.objects.get(username='admin'),
+                                    capacity=100, category=Category.objects.get())
+
+        for params in ({'page_size': 500}, {'page_size': 500, 'count': 0}, {'page_size': 500, 'cursor': ''}):
+            self.assertEqual(len(self.client.get('/activities/', params).json()['results']), 100, params)
+
+
+class StudentRankTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(name='Công nghệ thông tin', code='IT')
+        self.classes = [Class.objects.create(name=f'IT0{i}', code=f'IT0{i}', department=department) for i in range(2)]
+        self.students = [
+            User.objects.create(username=f'student{i}', student_class=self.classes[i % 2], department=department,
+                                total_score=score)
+            for i, score in enumerate([50, 80, 80, 65, 90])
+        ]
+        User.objects.create(username='staff', role='staff', total_score=100)
+
+    def rank(self, index):
+        student = User.objects.get(pk=self.students[index].pk)
+        return stats.student_rank(student)
+
+    def test_ranks_share_ties(self):
+        result = self.rank(2)
+        self.assertEqual(result['class'], {'rank': 2, 'total': 3, 'percentile': 66.7})
+        self.assertEqual(result['school'], {'rank': 2, 'total': 5, 'percentile': 80.0})
+        self.assertEqual(self.rank(1)['school'], {'rank': 2, 'total': 5, 'percentile': 80.0})
+        self.assertEqual(self.rank(0)['class'], {'rank': 3, 'total': 3, 'percentile': 33.3})
+
+    def test_warm_cache_runs_no_queries(self):
+        student = User.objects.get(pk=self.students[0].pk)
+        stats.student_rank(student)
+        with self.assertNumQueries(0):
+            stats.student_rank(student)
+
+    def test_score_change_forgets_only_its_scopes(self):
+        student = User.objects.get(pk=self.students[0].pk)
+        stats.student_rank(student)
+        stats.student_rank(User.objects.get(pk=self.students[1].pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups.add_to_total_score(self.students[3].pk, 30)
+
+        # Lớp IT00 vẫn còn trong cache, lớp IT01 và toàn trường được tải lại
+        with self.assertNumQueries(2):
+            result = stats.student_rank(student)
+        self.assertEqual(result['class'], {'rank': 3, 'total': 3, 'percentile': 33.3})
+        self.assertEqual(result['school'], {'rank': 5, 'total': 5, 'percentile': 20.0})
+        self.assertEqual(self.rank(3)['class'], {'rank': 1, 'total': 2, 'percentile': 100.0})
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        self.activity = Activity.objects.create(title='Hiến máu', description='', start_date=datetime.date(2025, 1, 1),
+                                                end_date=datetime.date(2025, 1, 2), created_by=self.admin, capacity=100,
+                                                category=Category.objects.create(name='Tình nguyện'))
+        group = EvaluationGroup.objects.create(name='Hoạt động xã hội', max_score=20)
+        EvaluationCriteria.objects.create(group=group, name='Tham gia', score=5, activity=self.activity)
+        self.students = [User.objects.create(username=f'student{i}') for i in range(3)]
+        for student in self.students:
+            Registration.objects.create(student=student, activity=self.activity)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, rows, query='partial=1'):
+        lines = ['Student ID,Activity ID,Attendance,Score', *rows]
+        file = SimpleUploadedFile('diem_danh.csv', ('\n'.join(lines) + '\n').encode())
+        response = self.client.post(f'/participation/upload-csv/?{query}', {'file': file}, format='multipart')
+        for job in ImportJob.objects.all():
+            self.addCleanup(job.file.delete, save=False)
+            if job.error_file:
+                self.addCleanup(job.error_file.delete, save=False)
+        return response
+
+    def test_import_files_are_private(self):
+        response = self.upload([f'{self.students[0].id},{self.activity.id},x,5', f'999,{self.activity.id},x,5'])
+
+        job = ImportJob.objects.get()
+        self.assertNotIn('error_file', response.data)
+        for file in (job.file, job.error_file):
+            self.assertFalse(os.path.abspath(file.path).startswith(os.path.abspath(settings.MEDIA_ROOT)), file.path)
+
+        errors = self.client.get(response.data['errors_url'])
+        self.assertEqual(errors.status_code, 200)
+        self.assertIn('Student 999 does not exist', b''.join(errors.streaming_content).decode('utf-8-sig'))
+
+        student = APIClient()
+        student.force_authenticate(self.students[0])
+        self.assertEqual(student.get(response.data['errors_url']).status_code, 403)
+
+    def test_run_failure_survives_error_cap(self):
+        rows = [f'x{i},{self.activity.id},x,5' for i in range(3)]
+        with mock.patch.object(jobs, 'MAX_STORED_ERRORS', 2), \
+                mock.patch.object(AttendanceImporter, 'import_batch', side_effect=RuntimeError('database went away')):
+            response = self.upload(rows)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertEqual(response.data['failure_reason'], 'database went away')
+        self.assertEqual(response.data['failed_rows'], 3)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+
+    def test_orphaned_job_can_be_resumed(self):
+        rows = [f'{student.id},{self.activity.id},x,5' for student in self.students[:2]]
+        # Job nền chưa kịp chạy (on_commit không được thực thi trong TestCase), như khi tiến trình bị khởi động lại
+        job_id = self.upload(rows, query='mode=background').data['job_id']
+        ImportJob.objects.filter(pk=job_id).update(status='running', checkpoint=2, attempt=1)
+
+        resume = f'/participation/import-jobs/{job_id}/resume/'
+        self.assertEqual(self.client.post(resume).status_code, 409)
+
+        ImportJob.objects.filter(pk=job_id).update(
+            updated_date=datetime.datetime.now(datetime.timezone.utc) - jobs.STALE_AFTER * 2)
+        self.assertEqual(self.client.post(resume).status_code, 202)
+        self.assertEqual(self.client.post(resume).status_code, 409)
+
+        jobs.run_import_job(job_id, close_connections=False)
+        # Lần gửi job thứ hai (job đã xong) không chạy lại
+        jobs.run_import_job(job_id, close_connections=False)
+
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempt, job.checkpoint, job.processed_rows), ('completed', 2, 3, 1))
+        self.assertEqual([User.objects.get(pk=student.pk).total_score for student in self.students], [0, 5, 0])
+
+    def test_superseded_worker_stops_writing(self):
+        rows = [f'{student.id},{self.activity.id},x,5' for student in self.students]
+        job_id = self.upload(rows, query='mode=background&chunk_size=1').data['job_id']
+        import_batch = AttendanceImporter.import_batch
+
+        def resumed_elsewhere(importer, batch):
+            import_batch(importer, batch)
+            # Worker khác nhận job ngay sau lô đầu tiên của worker này
+            ImportJob.objects.filter(pk=job_id).update(status='running', attempt=F('attempt') + 1)
+
+        with mock.patch.object(AttendanceImporter, 'import_batch', resumed_elsewhere):
+            jobs.run_import_job(job_id, close_connections=False)
+
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempt, job.checkpoint, job.finished_at), ('running', 2, 0, None))
+        self.assertEqual([User.objects.get(pk=student.pk).total_score for student in self.students], [5, 0, 0])
+
+
+class AttendanceImporterTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+        group = EvaluationGroup.objects.create(name='Hoạt động xã hội', max_score=20)
+        self.activities = []
+        for title in ('Hiến máu', 'Mùa hè xanh'):
+            activity = Activity.objects.create(title=title, description='', start_date=datetime.date(2025, 1, 1),
+                                               end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                               category=category)
+            EvaluationCriteria.objects.create(group=group, name=f'Tham gia {title}', score=5, activity=activity)
+            self.activities.append(activity)
+        self.students = [User.objects.create(username=f'student{i}') for i in range(3)]
+        for student in self.students:
+            for activity in self.activities:
+                Registration.objects.create(student=student, activity=activity)
+
+    def rows(self, *values):
+        return [{'Student ID': str(student.pk), 'Activity ID': str(activity.pk), 'Attendance': attendance,
+                 'Score': str(score)} for student, activity, attendance, score in values]
+
+    def test_import_writes_points_and_recomputes_scores(self):
+        first, second = self.activities
+        importer = AttendanceImporter()
+        self.assertTrue(importer.run(self.rows(
+            (self.students[0], first, 'x', 8),
+            (self.students[0], second, 'x', 7),
+            (self.students[1], first, '', 4),
+            # Dòng trùng: dòng sau ghi đè dòng trước
+            (self.students[1], first, 'x', 6),
+        ), chunk_size=2))
+
+        self.assertEqual(importer.summary()['rows'], 4)
+        self.assertEqual(set(Participation.objects.values_list('student_id', 'activity_id', 'is_completed')), {
+            (self.students[0].pk, first.pk, True), (self.students[0].pk, second.pk, True),
+            (self.students[1].pk, first.pk, True),
+        })
+        self.assertEqual(DisciplinePoint.objects.get(student=self.students[1], activity=first).score, 6)
+        self.assertEqual(User.objects.get(pk=self.students[0].pk).total_score, 15)
+        self.assertEqual(User.objects.get(pk=self.students[1].pk).total_score, 6)
+
+    def test_reimport_only_writes_changed_rows(self):
+        first, second = self.activities
+        rows = self.rows((self.students[0], first, 'x', 8), (self.students[1], first, 'x', 5))
+        AttendanceImporter().run(rows)
+
+        importer = AttendanceImporter()
+        importer.run(rows[:1] + self.rows((self.students[1], first, 'x', 9)))
+        self.assertEqual(importer.unchanged, 1)
+        self.assertEqual(DisciplinePoint.objects.count(), 2)
+        self.assertEqual(Participation.objects.count(), 2)
+        self.assertEqual(User.objects.get(pk=self.students[1].pk).total_score, 9)
+
+    def test_invalid_row_aborts_unless_partial(self):
+        first = self.activities[0]
+        rows = self.rows((self.students[0], first, 'x', 8)) + [
+            {'Student ID': 'abc', 'Activity ID': str(first.pk), 'Attendance': 'x', 'Score': '5'},
+            {'Student ID': '999', 'Activity ID': str(first.pk), 'Attendance': 'x', 'Score': '5'},
+        ]
+
+        importer = AttendanceImporter()
+        self.assertFalse(importer.run(rows))
+        self.assertEqual(DisciplinePoint.objects.count(), 0)
+
+        importer = AttendanceImporter(partial=True)
+        self.assertFalse(importer.run(rows))
+        self.assertEqual([(error['row'], error['error']) for error in importer.errors],
+                         [(3, 'Invalid Student ID: abc'), (4, 'Student 999 does not exist')])
+        self.assertEqual(User.objects.get(pk=self.students[0].pk).total_score, 8)
+
+    def test_open_csv_reads_gzip(self):
+        content = f'\ufeffStudent ID,Activity ID,Attendance,Score\n{self.students[2].pk},{self.activities[1].pk},x,3\n'
+        rows = list(imports.open_csv(io.BytesIO(gzip.compress(content.encode('utf-8')))))
+        self.assertEqual(rows, self.rows((self.students[2], self.activities[1], 'x', 3)))
+
+
+class ActivitySearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+
+        def create(title, description='', tags=()):
+            activity = Activity.objects.create(title=title, description=description, start_date=datetime.date(2025, 1, 1),
+                                               end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                               category=category)
+            for name in tags:
+                activity.tags.add(Tag.objects.get_or_create(name=name)[0])
+            return activity
+
+        self.summer = create('Mùa hè xanh 2025')
+        self.blood = create('Hiến máu nhân đạo', '<p>Tổ chức vào <b>mùa hè</b> tại Hà Nội</p>')
+        self.seminar = create('Hội thảo khoa học', tags=['Mùa hè'])
+        self.other = create('Chào tân sinh viên')
+
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def search(self, q):
+        data = self.client.get('/activities/', {'q': q, 'page_size': 10}).json()
+        return [activity['id'] for activity in data['results']], data['truncated']
+
+    def test_fold(self):
+        self.assertEqual(search.fold('Hoạt Động ĐOÀN Thanh Niên'), 'hoat dong doan thanh nien')
+        self.assertEqual(search.tokens('<Mùa hè>, xanh!'), ['mua', 'he', 'xanh'])
+
+    def test_ranked_accent_insensitive_search(self):
+        ids, truncated = self.search('MUA HE')
+        # Khớp tiêu đề xếp trước khớp mô tả/tag
+        self.assertEqual(ids[0], self.summer.id)
+        self.assertEqual(set(ids), {self.summer.id, self.blood.id, self.seminar.id})
+        self.assertFalse(truncated)
+
+        self.assertEqual(self.search('hien ma')[0], [self.blood.id])
+        self.assertEqual(self.search('hà nội')[0], [self.blood.id])
+
+    def test_index_follows_edits(self):
+        self.other.title = 'Chào tân sinh viên mùa hè'
+        self.other.save()
+        self.seminar.tags.clear()
+
+        self.assertEqual(set(search.search_activity_ids('mua he')), {self.summer.id, self.blood.id, self.other.id})
+
+    def test_like_fallback_matches_fts(self):
+        with mock.patch.object(search, 'backend', return_value='like'):
+            self.assertEqual(search.search_activity_ids('mua he')[0], self.summer.id)
+            self.assertEqual(set(search.search_activity_ids('mua he')), {self.summer.id, self.blood.id, self.seminar.id})
+
+    def test_mysql_short_words_are_filtered_with_like(self):
+        self.assertEqual(search.mysql_terms(search.tokens('Mùa hè xanh ở Hà Nội'), 3),
+                         (['mua', 'xanh', 'noi'], ['he', 'o', 'ha']))
+        self.assertEqual(search.mysql_terms(search.tokens('Lễ ra quân'), 3), (['quan'], ['le', 'ra']))
+
+    def test_truncated_results_are_flagged(self):
+        with mock.patch.object(search, 'SEARCH_LIMIT', 2):
+            ids, truncated = self.search('mua he')
+        self.assertEqual(len(ids), 2)
+        self.assertTrue(truncated)
+
+
+class ScoreRollupTests(TestCase):
+    def setUp(self):
+        self.departments = [Department.objects.create(name=f'Khoa {i}', code=f'K{i}') for i in range(2)]
+        self.classes = [Class.objects.create(name=f'Lớp {i}', code=f'L{i}', department=self.departments[i % 2])
+                        for i in range(3)]
+        self.students = [
+            User.objects.create(username=f'student{i}', student_class=self.classes[i % 3],
+                                department=self.departments[i % 3 % 2], total_score=score)
+            for i, score in enumerate([95, 80, 60, 40, 77, 91])
+        ]
+
+    def assertRollupsMatchUsers(self):
+        # So sánh rollup cập nhật theo delta với kết quả tổng hợp lại từ bảng User
+        for model, key_field in rollups.ROLLUPS:
+            expected = {row.pop(key_field): row
+                        for row in User.objects.order_by().values(key_field).annotate(**rollups._aggregates())}
+            stored = {getattr(rollup, key_field): rollup for rollup in model.objects.all()}
+            for key, rollup in stored.items():
+                row = expected.get(key, {'student_count': 0, 'score_sum': 0, 'score_sum_squares': 0,
+                                         **{bucket: 0 for bucket in rollups.BUCKET_FIELDS}})
+                for field, value in row.items():
+                    self.assertAlmostEqual(getattr(rollup, field), value or 0, msg=(model.__name__, key, field))
+            self.assertLessEqual(expected.keys(), stored.keys(), model.__name__)
+
+    def test_created_students_are_counted(self):
+        self.assertRollupsMatchUsers()
+        rollup = ClassScoreRollup.objects.get(student_class=self.classes[0])
+        self.assertEqual((rollup.student_count, rollup.score_sum, rollup.excellent, rollup.poor), (2, 135, 1, 1))
+
+    def test_student_moves_class_and_department(self):
+        student = User.objects.get(pk=self.students[0].pk)
+        student.student_class = self.classes[1]
+        student.department = self.departments[1]
+        student.save()
+
+        self.assertRollupsMatchUsers()
+        self.assertEqual(ClassScoreRollup.objects.get(student_class=self.classes[0]).student_count, 1)
+        self.assertEqual(DepartmentScoreRollup.objects.get(department=self.departments[1]).excellent, 1)
+
+    def test_score_delta_moves_bucket(self):
+        rollups.add_to_total_score(self.students[3].pk, 52)
+        rollups.add_to_total_score(self.students[1].pk, -35)
+
+        self.assertRollupsMatchUsers()
+        rollup = ClassScoreRollup.objects.get(student_class=self.classes[0])
+        self.assertEqual((rollup.score_sum, rollup.excellent, rollup.poor), (187, 2, 0))
+
+    def test_stale_save_after_delta_is_not_counted_twice(self):
+        stale = User.objects.get(pk=self.students[2].pk)
+        rollups.add_to_total_score(stale.pk, 20)
+        stale.first_name = 'An'
+        stale.save()
+
+        self.assertRollupsMatchUsers()
+
+    def test_delete_student_and_class(self):
+        self.students[4].delete()
+        self.assertRollupsMatchUsers()
+
+        class_id = self.classes[2].pk
+        self.classes[2].delete()
+        self.assertRollupsMatchUsers()
+        self.assertFalse(ClassScoreRollup.objects.filter(student_class_id=class_id).exists())
+
+
+class ScoreExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        self.export_dir = export_dir.name
+        override = override_settings(EXPORT_CACHE_DIR=self.export_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        department = Department.objects.create(name='Công nghệ thông tin', code='CNTT')
+        student_class = Class.objects.create(name='Lớp 1', code='L1', department=department)
+        for i, score in enumerate([95, 80, 60, 40]):
+            User.objects.create(username=f'student{i}', student_class=student_class, department=department,
+                                total_score=score)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def cached_files(self):
+        return sorted(os.listdir(self.export_dir))
+
+    def test_csv_streams_and_caches_on_first_request(self):
+        response = self.client.get('/csv/download/')
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(self.cached_files(), [])
+
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rows[0], ['Student', 'Class', 'Department', 'Score', 'Classification'])
+        self.assertEqual(rows[1], ['admin', 'N/A', 'N/A', '0.0', 'Poor'])
+        self.assertEqual(rows[2], ['student0', 'Lớp 1', 'Công nghệ thông tin', '95.0', 'Excellent'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(self.cached_files()), 1)
+
+        cached = self.client.get('/csv/download/')
+        self.assertIsInstance(cached, FileResponse)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(b''.join(cached.streaming_content).decode('utf-8'),
+                         ''.join(f'{",".join(row)}\r\n' for row in rows))
+
+        not_modified = self.client.get('/csv/download/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_gzip_csv_matches_plain_csv(self):
+        plain = b''.join(self.client.get('/csv/download/').streaming_content)
+        response = self.client.get('/csv/download/?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('user_scores.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+        # Nhiều khối nén nối tiếp nhau vẫn giải nén ra đúng nội dung
+        rows = ([f'student{i}', i] for i in range(1200))
+        chunks = list(exports.iter_csv(['Student', 'Score'], rows, compress=True, rows_per_chunk=100, bom=True))
+        content = gzip.decompress(b''.join(chunks)).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeffStudent,Score\r\nstudent0,0\r\n'))
+        self.assertEqual(content.count('\r\n'), 1201)
+
+    def test_interrupted_stream_is_not_cached(self):
+        def failing_chunks():
+            yield b'a'
+            raise RuntimeError('mất kết nối cơ sở dữ liệu')
+
+        path = os.path.join(self.export_dir, 'api-csv-3-1')
+        stream = exports._tee_artifact(path, 'api-csv', 3, iter([b'a', b'b']))
+        self.assertEqual(next(stream), b'a')
+        # Client ngắt kết nối: server đóng iterator giữa chừng
+        stream.close()
+        self.assertEqual(self.cached_files(), [])
+
+        with self.assertRaises(RuntimeError):
+            list(exports._tee_artifact(path, 'api-csv', 3, failing_chunks()))
+        self.assertEqual(self.cached_files(), [])
+
+        self.assertEqual(b''.join(exports._tee_artifact(path, 'api-csv', 3, iter([b'a', b'b']))), b'ab')
+        self.assertEqual(self.cached_files(), ['api-csv-3-1'])
+
+    def test_version_bump_replaces_cached_file(self):
+        first = self.client.get('/csv/download/?gzip=1')
+        b''.join(first.streaming_content)
+        versions._bump([versions.SCORES])
+
+        second = self.client.get('/csv/download/?gzip=1', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        b''.join(second.streaming_content)
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_pdf_report_paginates_all_rows(self):
+        report = exports.ScorePDFReport('Bảng điểm', ['Student', 'Score'], [100, 60])
+        rows = [[f'student{i}', i % 100] for i in range(100)]
+        output = report.write(io.BytesIO(), iter(rows))
+
+        first_page, other_pages = report.rows_per_page(True), report.rows_per_page(False)
+        expected_pages = 1 + -(-(len(rows) - first_page) // other_pages)
+        self.assertEqual((report.rows, report.pages), (len(rows), expected_pages))
+        self.assertTrue(output.getvalue().startswith(b'%PDF'))
+        self.assertEqual(output.getvalue().count(b'/Type /Page\n'), expected_pages)
+
+        response = self.client.get('/pdf/download/')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_admin_exports_require_staff_login(self):
+        for url in ('/admin/export-csv/', '/admin/export-pdf/', '/admin/score-stats/'):
+            response = self.client_class().get(url)
+            self.assertEqual(response.status_code, 302, url)
+            self.assertIn('/admin/login/', response['Location'])
+
+        self.client.logout()
+        self.client.force_login(User.objects.get(username='student0'))
+        self.assertEqual(self.client.get('/admin/export-csv/').status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/export-csv/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('student0,L1,CNTT,95.0,Xuất Sắc', b''.join(response.streaming_content).decode('utf-8'))
+
+
+class RegistrationExportTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        category = Category.objects.create(name='Tình nguyện')
+        self.activities = [
+            Activity.objects.create(title=title, description='', start_date=datetime.date(2025, 1, day),
+                                    end_date=datetime.date(2025, 1, day), created_by=admin, capacity=100,
+                                    category=category)
+            for day, title in enumerate(('Hiến máu', 'Mùa hè xanh', 'Tiếp sức mùa thi'), start=1)
+        ]
+        self.students = [User.objects.create(username=f'student{i}', first_name=f'Văn {i}', last_name='Nguyễn')
+                         for i in range(3)]
+        for student in self.students:
+            Registration.objects.create(student=student, activity=self.activities[0])
+        Registration.objects.create(student=self.students[2], activity=self.activities[1])
+
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_activity_csv_lists_registrations(self):
+        activity = self.activities[0]
+        response = self.client.get('/registration/export-csv/', {'activity_id': activity.pk})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(rows[0], exports.REGISTRATION_HEADER)
+        self.assertEqual(rows[1:], [[str(student.pk), f'Văn {i} Nguyễn', str(activity.pk), 'Hiến máu', '', '']
+                                    for i, student in enumerate(self.students)])
+
+        self.assertEqual(self.client.get('/registration/export-csv/', {'activity_id': 999}).status_code, 404)
+
+    def test_zip_has_one_csv_per_activity(self):
+        response = self.client.get('/registration/export-zip/',
+                                   {'activity_ids': ','.join(str(activity.pk) for activity in self.activities)})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        with mock.patch.object(exports, 'registration_rows', wraps=exports.registration_rows) as rows:
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(rows.call_count, 1)
+        self.assertEqual(archive.namelist(), [f'registrations_{activity.pk}.csv' for activity in self.activities])
+
+        def read(activity):
+            content = archive.read(f'registrations_{activity.pk}.csv').decode('utf-8-sig')
+            return list(csv.reader(io.StringIO(content)))
+
+        self.assertEqual(len(read(self.activities[0])), 4)
+        self.assertEqual(read(self.activities[1]),
+                         [exports.REGISTRATION_HEADER,
+                          [str(self.students[2].pk), 'Văn 2 Nguyễn', str(self.activities[1].pk), 'Mùa hè xanh', '', '']])
+        # Hoạt động chưa có đăng ký vẫn có file, chỉ gồm dòng tiêu đề
+        self.assertEqual(read(self.activities[2]), [exports.REGISTRATION_HEADER])
+
+    def test_zip_by_date_range_and_limits(self):
+        response = self.client.get('/registration/export-zip/', {'start_date': '2025-01-02', 'end_date': '2025-01-03'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), [f'registrations_{activity.pk}.csv' for activity in self.activities[1:]])
+
+        with mock.patch.object(exports, 'MAX_ZIP_ACTIVITIES', 2):
+            response = self.client.get('/registration/export-zip/', {'start_date': '2025-01-01', 'end_date': '2025-01-03'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/registration/export-zip/').status_code, 400)
+
+
+class DisciplineExportTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        activity = Activity.objects.create(title='Hiến máu', description='', start_date=datetime.date(2025, 1, 1),
+                                           end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                           category=Category.objects.create(name='Tình nguyện'))
+        group = EvaluationGroup.objects.create(name='Hoạt động xã hội', max_score=20)
+        criteria = EvaluationCriteria.objects.create(group=group, name='Tham gia', score=5, activity=activity)
+        student = User.objects.create(username='student0')
+        self.points = [DisciplinePoint.objects.create(student=student, activity=activity, criteria=criteria, score=score)
+                       for score in (1, 2, 3, 4)]
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.old = now - datetime.timedelta(hours=1)
+        # Hai dòng cùng updated_date, một dòng ngay trước mốc lùi và một dòng mới ghi (có thể chưa commit ở nơi khác)
+        for point, updated in zip(self.points, (self.old, self.old, now - exports.DISCIPLINE_WATERMARK_LAG * 2, now)):
+            DisciplinePoint.objects.filter(pk=point.pk).update(updated_date=updated)
+
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def export(self, **params):
+        response = self.client.get('/disciplined/export/', params)
+        content = b''.join(response.streaming_content)
+        if response['Content-Type'] == 'application/gzip':
+            content = gzip.decompress(content)
+        return response, [json.loads(line) for line in content.decode('utf-8').splitlines()]
+
+    def test_ndjson_export_has_all_rows(self):
+        response, rows = self.export()
+        self.assertEqual([row['id'] for row in rows], [point.pk for point in self.points])
+        self.assertEqual(list(rows[0]), exports.DISCIPLINE_COLUMNS)
+        self.assertEqual((rows[0]['student'], rows[0]['activity'], rows[0]['group'], rows[0]['score']),
+                         ('student0', 'Hiến máu', 'Hoạt động xã hội', 1))
+
+        plain, plain_rows = self.export(gzip='0')
+        self.assertEqual(plain['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(plain_rows, rows)
+
+    def test_watermark_lags_behind_recent_writes(self):
+        response, _ = self.export()
+        watermark = datetime.datetime.fromisoformat(response['X-Watermark'])
+        updated = dict(DisciplinePoint.objects.values_list('pk', 'updated_date'))
+        self.assertLess(updated[self.points[2].pk], watermark)
+        self.assertLess(watermark, updated[self.points[3].pk])
+
+        # Dòng ghi gần đây được xuất lại ở các lần sau cho tới khi cũ hơn DISCIPLINE_WATERMARK_LAG
+        for _ in range(2):
+            response, rows = self.export(updated_since=watermark.isoformat())
+            self.assertEqual([row['id'] for row in rows], [self.points[3].pk])
+            watermark = datetime.datetime.fromisoformat(response['X-Watermark'])
+            self.assertLess(watermark, updated[self.points[3].pk])
+
+    def test_keyset_chunks_do_not_skip_equal_timestamps(self):
+        chunks = list(exports.discipline_point_chunks(self.old - datetime.timedelta(seconds=1), chunk_size=1))
+        self.assertEqual([row[0] for chunk in chunks for row in chunk], [point.pk for point in self.points])
+        self.assertEqual(self.client.get('/disciplined/export/', {'updated_since': 'not-a-date'}).status_code, 400)
+
+
+class ScoreStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.departments = [Department.objects.create(name=name, code=code)
+                            for name, code in (('Công nghệ thông tin', 'CNTT'), ('Kinh tế', 'KT'))]
+        # Hai lớp cùng tên ở hai khoa khác nhau
+        self.classes = [Class.objects.create(name='K21', code=f'K21-{department.code}', department=department)
+                        for department in self.departments]
+        self.students = []
+        for index, (class_index, score) in enumerate([(0, 95), (0, 85), (0, 60), (1, 40), (1, 92)]):
+            self.students.append(User.objects.create(
+                username=f'student{index}', student_class=self.classes[class_index],
+                department=self.departments[class_index], total_score=score))
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    @staticmethod
+    def in_classes(rows):
+        # Bỏ nhóm chưa xếp lớp (tài khoản admin)
+        return [row for row in rows if row['student_class__name'] is not None]
+
+    def test_class_stats_from_rollups(self):
+        data = self.client.get('/stat/get/').json()
+
+        self.assertEqual([(row['total_score'], row['student_count'], row['avg_score'], row['std_score'])
+                          for row in self.in_classes(data['stats_by_class'])],
+                         [(240, 3, 80.0, 14.72), (132, 2, 66.0, 26.0)])
+        self.assertEqual([[row[bucket] for bucket in rollups.BUCKET_FIELDS]
+                          for row in self.in_classes(data['classification'])], [[1, 1, 1, 0], [1, 0, 0, 1]])
+        self.assertEqual([(row['department__name'], row['student_count']) for row in data['stats_by_department']],
+                         [(None, 1), ('Công nghệ thông tin', 3), ('Kinh tế', 2)])
+
+        single = self.client.get('/stat/get/', {'class': self.classes[1].pk}).json()
+        self.assertEqual(single['stats_by_class'], self.in_classes(data['stats_by_class'])[1:])
+        self.assertNotIn('stats_by_department', single)
+
+    def test_class_stats_cached_until_scores_change(self):
+        stats.class_stats()
+        with self.assertNumQueries(0):
+            stats.class_stats()
+
+        student = self.students[3]
+        student.student_class = self.classes[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        result = stats.class_stats()
+        self.assertEqual([(row['total_score'], row['student_count']) for row in self.in_classes(result['stats_by_class'])],
+                         [(280, 4), (92, 1)])
+        self.assertEqual(self.in_classes(result['classification'])[0]['poor'], 1)
+
+    def test_distribution_keeps_same_named_classes_apart(self):
+        data = self.client.get('/stat/distribution/', {'bins': 4, 'percentiles': '50'}).json()
+
+        self.assertEqual(data['bin_edges'], [0, 25, 50, 75, 100])
+        self.assertEqual([(group['id'], group['name'], group['count'], group['percentiles'], group['histogram'])
+                          for group in data['groups']], [
+            (self.classes[0].pk, 'K21', 3, {'p50': 85.0}, [0, 0, 1, 2]),
+            (self.classes[1].pk, 'K21', 2, {'p50': 66.0}, [0, 1, 0, 1]),
+        ])
+        self.assertEqual((data['overall']['count'], data['overall']['mean'], data['overall']['min'],
+                          data['overall']['max']), (5, 74.4, 40, 95))
+
+        departments = self.client.get('/stat/distribution/', {'group_by': 'department', 'bins': 4}).json()
+        self.assertEqual([(group['id'], group['histogram']) for group in departments['groups']],
+                         [(self.departments[0].pk, [0, 0, 1, 2]), (self.departments[1].pk, [0, 1, 0, 1])])
+
+        for params in ({'group_by': 'student'}, {'bins': 0}, {'percentiles': '101'}, {'percentiles': 'a'}):
+            self.assertEqual(self.client.get('/stat/distribution/', params).status_code, 400, params)
+
+    def test_leaderboard_ranks_ties_and_scopes(self):
+        tied = User.objects.create(username='student5', student_class=self.classes[1], department=self.departments[1],
+                                   total_score=92)
+
+        data = self.client.get('/leaderboard/').json()
+        self.assertEqual([(row['username'], row['rank']) for row in data], [
+            ('student0', 1), ('student4', 2), ('student5', 2), ('student1', 4), ('student2', 5), ('student3', 6),
+        ])
+        self.assertEqual(data[1]['student_class__name'], 'K21')
+
+        by_class = self.client.get('/leaderboard/', {'class': self.classes[1].pk}).json()
+        self.assertEqual([(row['id'], row['rank']) for row in by_class],
+                         [(self.students[4].pk, 1), (tied.pk, 1), (self.students[3].pk, 3)])
+        by_department = self.client.get('/leaderboard/', {'department': self.departments[0].pk, 'limit': 2}).json()
+        self.assertEqual([row['username'] for row in by_department], ['student0', 'student1'])
+
+        self.assertEqual(self.client.get('/leaderboard/', {'limit': stats.MAX_LEADERBOARD_SIZE + 1}).status_code, 400)
+
+    def test_leaderboard_cache_follows_scores_version(self):
+        stats.leaderboard(limit=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.leaderboard(limit=1)[0]['username'], 'student0')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='student5', total_score=99)
+        self.assertEqual(stats.leaderboard(limit=1)[0]['username'], 'student5')
+
+    def test_snapshots_feed_trend_endpoint(self):
+        call_command('snapshot_scores', '--date', '2025-03-01', '--batch-size', '2', stdout=io.StringIO())
+        student = self.students[3]
+        student.student_class = self.classes[0]
+        student.save()
+        # Chạy lại cùng ngày ghi đè ảnh chụp cũ
+        snapshots.take_snapshot(datetime.date(2025, 3, 2))
+        self.assertEqual(snapshots.take_snapshot(datetime.date(2025, 3, 2), batch_size=2), (2, 5))
+
+        data = self.client.get('/stat/trend/', {'start': '2025-03-01', 'end': '2025-03-02'}).json()
+        self.assertEqual([(series['class_id'], [(point['date'], point['student_count'], point['avg_score'])
+                                                for point in series['points']]) for series in data['classes']], [
+            (self.classes[0].pk, [('2025-03-01', 3, 80.0), ('2025-03-02', 4, 70.0)]),
+            (self.classes[1].pk, [('2025-03-01', 2, 66.0), ('2025-03-02', 1, 92.0)]),
+        ])
+
+        one_day = self.client.get('/stat/trend/', {'class': self.classes[1].pk, 'start': '2025-03-02',
+                                                   'end': '2025-03-02'}).json()
+        self.assertEqual([len(series['points']) for series in one_day['classes']], [1])
+
+        trend = self.client.get('/stat/trend/', {'student': self.students[0].pk, 'start': '2025-03-01',
+                                                 'end': '2025-03-31'}).json()
+        self.assertEqual(trend['points'], [{'date': '2025-03-01', 'total_score': 95.0},
+                                           {'date': '2025-03-02', 'total_score': 95.0}])
+        # Tài khoản không phải sinh viên không được chụp
+        self.assertFalse(StudentScoreSnapshot.objects.filter(student=self.admin).exists())
+
+        self.assertEqual(self.client.get('/stat/trend/', {'start': '2025-03-02', 'end': '2025-03-01'}).status_code, 400)
+
+
+class ActivityListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True, role='admin')
+        self.categories = [Category.objects.create(name=name) for name in ('Tình nguyện', 'Học thuật')]
+        self.activities = [
+            Activity.objects.create(title=title, description='', start_date=datetime.date(2025, 1, 1),
+                                    end_date=datetime.date(2025, 1, 2), created_by=admin, capacity=100,
+                                    category=category)
+            for title, category in (('Hiến máu', self.categories[0]), ('Hội thảo', self.categories[1]))
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    @staticmethod
+    def key(query):
+        return listings.activity_list_key(Request(APIRequestFactory().get('/activities/', query)))
+
+    def titles(self, **params):
+        return sorted(activity['title'] for activity in self.client.get('/activities/', params).json()['results'])
+
+    def test_key_normalizes_filters(self):
+        self.assertEqual(self.key({'q': 'Hiến  MÁU'}), self.key({'q': 'hien mau'}))
+        self.assertEqual(self.key({'page': '1', 'utm_source': 'mail', 'tag': ''}), self.key({}))
+        self.assertNotEqual(self.key({'category_id': self.categories[0].pk}), self.key({}))
+        self.assertNotEqual(self.key({'page': '2'}), self.key({}))
+        # cursor= rỗng là trang đầu của chế độ cursor, khác với trang đầu theo số trang
+        self.assertNotEqual(self.key({'cursor': ''}), self.key({}))
+
+    def test_cached_listing_is_invalidated_on_save(self):
+        self.assertEqual(self.titles(), ['Hiến máu', 'Hội thảo'])
+        self.assertEqual(self.titles(category_id=self.categories[1].pk), ['Hội thảo'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(category_id=self.categories[1].pk), ['Hội thảo'])
+
+        # Không qua signal thì cache vẫn trả dữ liệu cũ: chứng tỏ kết quả được đọc từ cache
+        Activity.objects.filter(pk=self.activities[1].pk).update(title='Hội thảo khoa học')
+        self.assertEqual(self.titles(), ['Hiến máu', 'Hội thảo'])
+
+        activity = Activity.objects.get(pk=self.activities[0].pk)
+        activity.category = self.categories[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.save()
+        self.assertEqual(self.titles(category_id=self.categories[1].pk), ['Hiến máu', 'Hội thảo khoa học'])
+
+        tag = Tag.objects.create(name='Mùa hè')
+        self.assertEqual(self.titles(tag='Mùa hè'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.tags.add(tag)
+        self.assertEqual(self.titles(tag='Mùa hè'), ['Hiến máu'])
 
-# Create your tests here.
@@ -20,6 +20,7 @@ r.register('disciplined', views.DisciplinePointViewSet, basename='discipline')
 r.register('report', views.ReportViewSet, basename='report')
 r.register('message', views.MessageViewSet, basename='message')
 r.register('stat', views.ScoreStatsViewSet, basename='stat')
+r.register('leaderboard', views.LeaderboardViewSet, basename='leaderboard')
 r.register('csv', views.ExportCSVViewSet, basename='csv')
 r.register('pdf', views.ExportPDFViewSet, basename='pdf')
 urlpatterns = [
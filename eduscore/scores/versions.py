@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import DataVersion
+
+# Tăng mỗi khi User.total_score, thông tin sinh viên, Class hoặc Department thay đổi
+SCORES = 'scores'
+# Tăng mỗi khi Activity, Tag hoặc Category thay đổi
+ACTIVITIES = 'activities'
+
+CACHE_TIMEOUT = 10
+
+
+def _cache_key(key):
+    return f'data-version:{key}'
+
+
+def get_version(key):
+    """Trả về (version, updated_date) của nhóm dữ liệu, ưu tiên đọc từ cache."""
+    value = cache.get(_cache_key(key))
+    if value is None:
+        data_version, _ = DataVersion.objects.get_or_create(key=key)
+        value = (data_version.version, data_version.updated_date)
+        cache.set(_cache_key(key), value, CACHE_TIMEOUT)
+    return value
+
+
+def _bump(keys):
+    now = timezone.now().replace(microsecond=0)
+    for key in keys:
+        updated = DataVersion.objects.filter(key=key).update(version=models.F('version') + 1, updated_date=now)
+        if not updated:
+            DataVersion.objects.get_or_create(key=key)
+        cache.delete(_cache_key(key))
+
+
+def bump_version(*keys):
+    # Chỉ tăng version sau khi transaction commit, tránh giữ khoá dòng DataVersion suốt transaction
+    transaction.on_commit(lambda: _bump(keys))
@@ -1,18 +1,17 @@
-import csv
+import datetime
 
-import io
-from django.db.models import Q, Sum, Count
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from firebase_admin import db
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from . import serializers, paginators
-from .models import Category, Activity, Participation, DisciplinePoint, Report, User, Comment, NewsFeed,Like,Message,Registration,EvaluationGroup, EvaluationCriteria,Department, Class
+from . import serializers, paginators, jobs, exports, listings, registrations, scoring, search, snapshots, stats
+from .imports import AttendanceImporter, open_csv
+from .models import Category, Activity, Participation, DisciplinePoint, Report, User, Comment, NewsFeed,Like,Message,Registration,EvaluationGroup, EvaluationCriteria,Department, Class, ImportJob
 from scores import perms
 
 class CategoryViewSet(viewsets.ViewSet, generics.ListAPIView):
@@ -23,7 +22,7 @@ class CategoryViewSet(viewsets.ViewSet, generics.ListAPIView):
 class ActivityViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     queryset = Activity.objects.prefetch_related('tags').filter(active=True)
     serializer_class = serializers.ActivityDetailsSerializer
-    pagination_class = paginators.ItemPaginator
+    pagination_class = paginators.FeedPaginator
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -33,16 +32,34 @@ class ActivityViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
         if category_id:
             query = query.filter(category_id=category_id)
 
-        search_keyword = self.request.query_params.get('q')
-        if search_keyword:
-            query = query.filter(title__icontains=search_keyword)
-
         tag_name = self.request.query_params.get('tag')
         if tag_name:
             query = query.filter(tags__name=tag_name)
 
         return query
 
+    def list(self, request, *args, **kwargs):
+        # Cache theo bộ lọc và trang; sửa Activity/Tag/Category sẽ tăng version nên không trả dữ liệu cũ
+        return Response(listings.cached_activity_list(request, lambda: self.list_data(request, *args, **kwargs)))
+
+    def list_data(self, request, *args, **kwargs):
+        search_keyword = request.query_params.get('q')
+        if not search_keyword:
+            return super().list(request, *args, **kwargs).data
+
+        # Tìm theo tiêu đề, mô tả và tag qua chỉ mục toàn văn; phân trang trên danh sách id đã xếp hạng
+        query = self.get_queryset()
+        activity_ids = search.search_activity_ids(search_keyword, search.SEARCH_LIMIT + 1)
+        # Chỉ SEARCH_LIMIT kết quả liên quan nhất được xếp hạng, báo cho client biết khi danh sách bị cắt
+        truncated = len(activity_ids) > search.SEARCH_LIMIT
+        activity_ids = search.ranked_ids(query, activity_ids[:search.SEARCH_LIMIT])
+        page = self.paginate_queryset(activity_ids)
+        activities = search.load_ranked(query, page if page is not None else activity_ids)
+        serializer = self.get_serializer(activities, many=True)
+        if page is not None:
+            return {**self.get_paginated_response(serializer.data).data, 'truncated': truncated}
+        return serializer.data
+
     @action(methods=['get'], url_path='participations', detail=True)
     def get_participations(self, request, pk):
         activity = self.get_object().participation_set.filter(active=True)
@@ -54,7 +71,9 @@ class ActivityViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
         if not perms.DestroyActivityPerms().has_object_permission(request, self, activity):
             return Response({'error': 'Permission denied.'}, status=status.HTTP_403_FORBIDDEN)
 
-        activity.delete()
+        # Điểm rèn luyện của hoạt động bị xoá theo cascade: tính lại mỗi sinh viên một lần
+        with transaction.atomic(), scoring.deferred_recompute():
+            activity.delete()
         return Response({'message': 'Activity deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
 
     def retrieve(self, request, *args, **kwargs):
@@ -88,67 +107,84 @@ class ParticipationViewSet(viewsets.ViewSet, generics.CreateAPIView):
         if not file:
             return Response({"detail": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # mode=stream: xử lý theo lô chunk_size dòng, mỗi lô một transaction
+        # mode=background: lưu file, chạy ở worker nền và trả về job_id ngay
+        # partial=1: ghi các dòng hợp lệ, lưu checkpoint và file CSV các dòng lỗi
+        mode = request.query_params.get('mode')
+        partial = request.query_params.get('partial') in ('1', 'true')
+        chunk_size = None
+        if mode in ('stream', 'background') or partial:
+            try:
+                chunk_size = min(max(int(request.query_params.get('chunk_size', 1000)), 1), 10000)
+            except ValueError:
+                return Response({"detail": "Invalid chunk_size."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if mode == 'background' or partial:
+            job = ImportJob.objects.create(created_by=request.user, file=file, chunk_size=chunk_size, partial=partial)
+            if mode == 'background':
+                jobs.submit_import(job)
+                return Response({"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED)
+
+            jobs.run_import_job(job.id, close_connections=False)
+            job.refresh_from_db()
+            return Response(serializers.ImportJobSerializer(job, context={'request': request}).data,
+                            status=status.HTTP_200_OK if job.status == 'completed' else status.HTTP_400_BAD_REQUEST)
+
         try:
-            decoded_file = file.read().decode('utf-8-sig')
-            csv_file = io.StringIO(decoded_file)
-            reader = csv.DictReader(csv_file)
-
-            for row in reader:
-                try:
-                    # Xử lý Student ID
-                    student_id_str = row['Student ID'].strip().replace('\ufeff', '').strip()
-                    if not student_id_str.isdigit():
-                        raise ValueError(f"Invalid Student ID: {student_id_str}")
-                    student_id = int(student_id_str)
-                    student = User.objects.get(id=student_id)
-
-                    # Xử lý Activity ID
-                    activity_id_str = row['Activity ID'].strip()
-                    if not activity_id_str.isdigit():
-                        raise ValueError(f"Invalid Activity ID: {activity_id_str}")
-                    activity_id = int(activity_id_str)
-                    activity = Activity.objects.get(id=activity_id)
-
-                    # Kiểm tra tiêu chí đánh giá
-                    criteria = EvaluationCriteria.objects.filter(activity=activity).first()
-                    if not criteria:
-                        raise ValueError(f"No valid criteria found for activity {activity_id}")
-
-                    # Kiểm tra đăng ký hoạt động
-                    registration = Registration.objects.filter(student=student, activity=activity).first()
-                    if not registration:
-                        raise ValueError(f"Student {student_id} is not registered for activity {activity_id}")
-
-                    # Xử lý Attendance: Nếu khác null, đánh dấu hoàn thành
-                    attendance = row.get('Attendance', '').strip().lower()
-                    is_completed = bool(attendance)  # Nếu attendance khác rỗng thì là True
-
-                    participation, created = Participation.objects.get_or_create(student=student, activity=activity)
-                    participation.is_completed = is_completed
-                    participation.save()
-
-                    # Xử lý điểm kỷ luật
-                    discipline_point = DisciplinePoint.objects.filter(student=student, activity=activity).first()
-                    if discipline_point:
-                        discipline_point.score = float(row.get('Score', 0))
-                        discipline_point.criteria = criteria
-                        discipline_point.save()
-                    else:
-                        discipline_point = DisciplinePoint(
-                            student=student, activity=activity,
-                            score=float(row.get('Score', 0)), criteria=criteria
-                        )
-                        discipline_point.save()
-
-                except Exception as e:
-                    return Response({"detail": f"Error processing row: {row} - {str(e)}"},
-                                    status=status.HTTP_400_BAD_REQUEST)
-
-            return Response({"detail": "CSV processed successfully."}, status=status.HTTP_200_OK)
+            importer = AttendanceImporter()
+            if not importer.run(open_csv(file), chunk_size=chunk_size):
+                error = importer.errors[0]
+                return Response({"detail": f"Error processing row: {error['data']} - {error['error']}",
+                                 "errors": importer.errors, **importer.summary()},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({"detail": "CSV processed successfully.", **importer.summary()}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['get'], url_path=r'import-jobs/(?P<job_id>\d+)', detail=False,
+            permission_classes=[permissions.IsAdminUser])
+    def import_status(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(id=job_id)
+        except ImportJob.DoesNotExist:
+            return Response({"detail": "Import job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(serializers.ImportJobSerializer(job, context={'request': request}).data)
+
+    @action(methods=['post'], url_path=r'import-jobs/(?P<job_id>\d+)/resume', detail=False,
+            permission_classes=[permissions.IsAdminUser])
+    def resume_import(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(id=job_id)
+        except ImportJob.DoesNotExist:
+            return Response({"detail": "Import job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Job lỗi, hoặc job mồ côi (tiến trình chạy nó đã dừng, không còn heartbeat), mới được chạy tiếp
+        if not jobs.claim_for_resume(job.id):
+            return Response({"detail": f"Only failed or stalled import jobs can be resumed (status: {job.status})."},
+                            status=status.HTTP_409_CONFLICT)
+
+        # Chạy tiếp từ checkpoint, các dòng đã ghi không bị xử lý và tính điểm lại
+        jobs.submit_import(job)
+        return Response({"job_id": job.id, "status": 'pending', "checkpoint": job.checkpoint},
+                        status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['get'], url_path=r'import-jobs/(?P<job_id>\d+)/errors', detail=False,
+            permission_classes=[permissions.IsAdminUser])
+    def import_errors(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(id=job_id)
+        except ImportJob.DoesNotExist:
+            return Response({"detail": "Import job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not job.error_file:
+            return Response({"detail": "This import has no error rows."}, status=status.HTTP_404_NOT_FOUND)
+
+        return FileResponse(job.error_file.open('rb'), as_attachment=True,
+                            filename=f'import_{job.id}_errors.csv', content_type='text/csv')
+
 class EvaluationGroupViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     queryset = EvaluationGroup.objects.all()
     serializer_class = serializers.EvaluationGroupSerializer
@@ -163,10 +199,10 @@ class DisciplinePointViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     queryset = DisciplinePoint.objects.all()
     serializer_class = serializers.DisciplinePointSerializer
     permission_classes = [permissions.IsAdminUser]
-    pagination_class = paginators.ItemPaginator
+    pagination_class = paginators.FeedPaginator
 
     def get_permissions(self):
-        if self.request.method == 'GET':
+        if self.request.method == 'GET' and self.action != 'export':
             return [permissions.IsAuthenticated()]
         return super().get_permissions()
 
@@ -185,9 +221,44 @@ class DisciplinePointViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
 
         return query
 
+    @action(methods=['get'], url_path='export', detail=False)
+    def export(self, request):
+        # Xuất toàn bộ điểm rèn luyện cho phân tích: ?output=ndjson (gzip, mặc định) hoặc parquet,
+        # ?updated_since=<watermark> chỉ lấy phần thay đổi; watermark mới trả về trong header X-Watermark
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'parquet'):
+            return Response({"detail": "output must be ndjson or parquet."}, status=status.HTTP_400_BAD_REQUEST)
+        if output == 'parquet' and exports.pyarrow is None:
+            return Response({"detail": "Parquet export requires pyarrow."}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            try:
+                updated_since = parse_datetime(updated_since)
+            except ValueError:
+                updated_since = None
+            if updated_since is None:
+                return Response({"detail": "Invalid updated_since."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+
+        # Watermark được lùi lại DISCIPLINE_WATERMARK_LAG và các dòng mới hơn nó vẫn được xuất: lần lấy sau có thể
+        # nhận lại vài dòng (phía nhận ghi đè theo id) nhưng không bỏ sót dòng của transaction commit muộn
+        watermark = exports.discipline_watermark(updated_since)
+        chunks = exports.discipline_point_chunks(updated_since)
+
+        if output == 'parquet':
+            response = exports.parquet_response('discipline_points.parquet', exports.discipline_parquet_schema(), chunks)
+        else:
+            response = exports.ndjson_response('discipline_points.ndjson', exports.DISCIPLINE_COLUMNS, chunks,
+                                               compress=request.query_params.get('gzip') not in ('0', 'false'))
+        if watermark:
+            response['X-Watermark'] = watermark.isoformat()
+        return response
+
 class ReportViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     serializer_class = serializers.ReportSerializer
-    pagination_class = paginators.ItemPaginator
+    pagination_class = paginators.FeedPaginator
 
     def get_queryset(self):
         if self.request.user.is_staff or self.request.user.is_superuser:
@@ -263,6 +334,19 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
         serializer = serializers.UserSerializer(request.user,context={'request': request})  # Truyền request vào context
         return Response(serializer.data)
 
+    @action(methods=['get'], url_path='my-rank', detail=False, permission_classes=[permissions.IsAuthenticated])
+    def get_my_rank(self, request):
+        if request.user.role != 'student':
+            return Response({"detail": "Only students are ranked."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats.student_rank(request.user))
+
+    @action(methods=['get'], url_path='dashboard', detail=False, permission_classes=[permissions.IsAuthenticated])
+    def get_dashboard(self, request):
+        recent = request.query_params.get('recent', str(stats.DEFAULT_RECENT_POINTS))
+        if not recent.isdigit() or not 1 <= int(recent) <= stats.MAX_RECENT_POINTS:
+            return Response({"detail": f"recent must be 1-{stats.MAX_RECENT_POINTS}."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats.student_dashboard(request.user.id, int(recent)))
+
     @action(methods=['post'], url_path='change-password', detail=False,
             permission_classes=[permissions.IsAuthenticated])
     def change_password(self, request):
@@ -293,7 +377,7 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
 class NewsFeedViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     queryset = NewsFeed.objects.filter(active=True)
     serializer_class = serializers.NewsFeedSerializer
-    pagination_class = paginators.ItemPaginator
+    pagination_class = paginators.FeedPaginator
     permission_classes = [permissions.AllowAny]
 
     def perform_create(self, serializer):
@@ -356,14 +440,44 @@ class NewsFeedViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
 class RegistrationViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     queryset = Registration.objects.filter(active=True)
     serializer_class = serializers.RegistrationSerializer
-    pagination_class = paginators.ItemPaginator
+    pagination_class = paginators.FeedPaginator
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Registration.objects.filter(student=self.request.user)
 
-    def perform_create(self, serializer):
-        serializer.save(student=self.request.user)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            registration = registrations.register(request.user, serializer.validated_data['activity'])
+        except registrations.ActivityFull:
+            # Hết chỗ: xếp vào hàng chờ thay vì để client gửi lại liên tục
+            waitlist = registrations.join_waitlist(request.user, serializer.validated_data['activity'])
+            if waitlist['status'] == 'registered':
+                return Response(waitlist, status=status.HTTP_201_CREATED)
+            return Response({"detail": "Activity is full.", **waitlist}, status=status.HTTP_409_CONFLICT)
+        except registrations.AlreadyRegistered:
+            return Response({"detail": "Already registered."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(self.get_serializer(registration).data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['get'], url_path='status', detail=False)
+    def registration_status(self, request):
+        activity_id = request.query_params.get('activity_id')
+        if not activity_id or not activity_id.isdigit():
+            return Response({"detail": "Activity ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(registrations.registration_status(request.user, int(activity_id)))
+
+    @action(methods=['post'], url_path='cancel', detail=False)
+    def cancel(self, request):
+        activity_id = str(request.data.get('activity', ''))
+        if not activity_id.isdigit():
+            return Response({"detail": "Activity ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if not registrations.cancel(request.user, int(activity_id)):
+            return Response({"detail": "Registration not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['get'], url_path='list', detail=False, permission_classes=[permissions.IsAdminUser])
     def get_list(self, request, activity_id=None):
@@ -392,22 +506,47 @@ class RegistrationViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
         except Activity.DoesNotExist:
             return Response({"detail": "Activity not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        registrations = Registration.objects.filter(activity=activity)
-
-        response = HttpResponse(content_type='text/csv', charset='utf-8-sig')
-        response['Content-Disposition'] = f'attachment; filename="registrations_{activity_id}.csv"'
+        rows = (
+            exports.registration_csv_row(activity.id, activity.title, *row[1:])
+            for row in exports.registration_rows([activity.id])
+        )
+        return exports.csv_response(f'registrations_{activity_id}.csv', exports.REGISTRATION_HEADER, rows, bom=True)
 
-        writer = csv.writer(response)
+    @action(methods=['get'], url_path='export-zip', detail=False, permission_classes=[permissions.IsAdminUser])
+    def export_zip(self, request):
+        # Xuất nhiều hoạt động một lần: ?activity_ids=1,2,3 hoặc ?start_date=...&end_date=... (theo ngày bắt đầu)
+        activities = Activity.objects.all()
 
-        writer.writerow(['Student ID', 'Student Name', 'Activity ID', 'Activity Title', 'Attendance','Score'])
+        activity_ids = request.query_params.get('activity_ids')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
 
-        for registration in registrations:
-            student_name = f"{registration.student.first_name} {registration.student.last_name}"
+        if activity_ids:
+            try:
+                ids = [int(value) for value in activity_ids.split(',') if value.strip()]
+            except ValueError:
+                return Response({"detail": "Invalid activity_ids."}, status=status.HTTP_400_BAD_REQUEST)
+            activities = activities.filter(id__in=ids)
+        elif start_date and end_date:
+            try:
+                start_date, end_date = parse_date(start_date), parse_date(end_date)
+            except ValueError:
+                start_date = end_date = None
+            if not start_date or not end_date:
+                return Response({"detail": "Invalid start_date or end_date."}, status=status.HTTP_400_BAD_REQUEST)
+            activities = activities.filter(start_date__range=(start_date, end_date))
+        else:
+            return Response({"detail": "activity_ids or start_date and end_date are required."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            writer.writerow(
-                [registration.student.id, student_name, activity.id, activity.title, ''])
+        activities = list(activities.order_by('id').values_list('id', 'title')[:exports.MAX_ZIP_ACTIVITIES + 1])
+        if not activities:
+            return Response({"detail": "Activity not found."}, status=status.HTTP_404_NOT_FOUND)
+        if len(activities) > exports.MAX_ZIP_ACTIVITIES:
+            return Response({"detail": f"At most {exports.MAX_ZIP_ACTIVITIES} activities can be exported at once."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        return response
+        return exports.registration_zip_response('registrations.zip', activities)
 
 class CommentViewSet(viewsets.ViewSet, generics.DestroyAPIView):
     queryset = Comment.objects.filter(active=True)
@@ -512,132 +651,89 @@ class ScoreStatsViewSet(viewsets.ViewSet):
     @action(methods=['get'], detail=False)
     def get(self, request):
         selected_class_id = request.GET.get('class')
+        if selected_class_id and not selected_class_id.isdigit():
+            return Response({"detail": "Invalid class."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if selected_class_id:
-            stats_by_class = (
-                User.objects.filter(student_class__id=selected_class_id)
-                .values('student_class__name')
-                .annotate(
-                    total_score=Sum('total_score'),
-                    student_count=Count('id')
-                )
-            )
-
-            for stat in stats_by_class:
-                stat['avg_score'] = stat['total_score'] / stat['student_count'] if stat['student_count'] > 0 else 0
-
-            classification = (
-                User.objects.filter(student_class__id=selected_class_id)
-                .values('student_class__name')
-                .annotate(
-                    excellent=Count('total_score', filter=Q(total_score__gte=90)),
-                    good=Count('total_score', filter=Q(total_score__gte=75, total_score__lt=90)),
-                    average=Count('total_score', filter=Q(total_score__gte=50, total_score__lt=75)),
-                    poor=Count('total_score', filter=Q(total_score__lt=50)),
-                )
-            )
-        else:
-            stats_by_class = (
-                User.objects.values('student_class__name')
-                .annotate(
-                    total_score=Sum('total_score'),
-                    student_count=Count('id')
-                )
-            )
-
-            for stat in stats_by_class:
-                stat['avg_score'] = round(stat['total_score'] / stat['student_count'], 2) if stat[
-                                                                                                 'student_count'] > 0 else 0
-
-            classification = (
-                User.objects.values('student_class__name')
-                .annotate(
-                    excellent=Count('total_score', filter=Q(total_score__gte=90)),
-                    good=Count('total_score', filter=Q(total_score__gte=75, total_score__lt=90)),
-                    average=Count('total_score', filter=Q(total_score__gte=50, total_score__lt=75)),
-                    poor=Count('total_score', filter=Q(total_score__lt=50)),
-                )
-            )
-
-        return Response({
-            "stats_by_class": list(stats_by_class),
-            "classification": list(classification)
-        })
+        return Response(stats.class_stats(selected_class_id))
+
+    @action(methods=['get'], detail=False)
+    def distribution(self, request):
+        # ?group_by=class|department&bins=10&percentiles=10,25,50,75,90
+        group_by = request.GET.get('group_by', 'class')
+        if group_by not in stats.DISTRIBUTION_GROUPS:
+            return Response({"detail": "group_by must be class or department."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            bins = int(request.GET.get('bins', 10))
+            percentiles = request.GET.get('percentiles')
+            percentiles = tuple(float(p) for p in percentiles.split(',')) if percentiles else stats.DEFAULT_PERCENTILES
+        except ValueError:
+            return Response({"detail": "Invalid bins or percentiles."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= bins <= stats.MAX_BINS or not percentiles or not all(0 <= p <= 100 for p in percentiles):
+            return Response({"detail": f"bins must be 1-{stats.MAX_BINS} and percentiles 0-100."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(stats.distribution(group_by, bins, percentiles))
+
+    @action(methods=['get'], detail=False)
+    def trend(self, request):
+        # Điểm theo ngày từ ảnh chụp: ?class=<id> hoặc ?student=<id>, ?start=YYYY-MM-DD&end=YYYY-MM-DD
+        try:
+            end = parse_date(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+            start = parse_date(request.GET['start']) if request.GET.get('start') else \
+                end - datetime.timedelta(days=snapshots.DEFAULT_TREND_DAYS)
+        except ValueError:
+            start = end = None
+        if not start or not end or start > end:
+            return Response({"detail": "Invalid start or end."}, status=status.HTTP_400_BAD_REQUEST)
+
+        class_id = request.GET.get('class')
+        student_id = request.GET.get('student')
+        if (class_id and not class_id.isdigit()) or (student_id and not student_id.isdigit()):
+            return Response({"detail": "Invalid class or student."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if student_id:
+            return Response({'student': int(student_id), 'start': start, 'end': end,
+                             'points': snapshots.student_trend(student_id, start, end)})
+        return Response({'start': start, 'end': end, 'classes': snapshots.class_trend(start, end, class_id)})
+
+class LeaderboardViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        # ?class=<id> hoặc ?department=<id> (không có thì xếp hạng toàn trường), ?limit=50
+        class_id = request.GET.get('class')
+        department_id = request.GET.get('department')
+        limit = request.GET.get('limit', str(stats.DEFAULT_LEADERBOARD_SIZE))
+        if any(value and not value.isdigit() for value in (class_id, department_id, limit)) \
+                or not 1 <= int(limit) <= stats.MAX_LEADERBOARD_SIZE:
+            return Response({"detail": f"class and department must be IDs, limit 1-{stats.MAX_LEADERBOARD_SIZE}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(stats.leaderboard(class_id, department_id, int(limit)))
 
 class ExportCSVViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAdminUser]
 
     @action(methods=['get'], detail=False, url_path="download")  # Đổi thành @action để hiển thị API
     def download_csv(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="user_scores.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Student', 'Class', 'Department', 'Score', 'Classification'])
-
-        users = User.objects.select_related('student_class', 'department')
-        for user in users:
-            classification = (
-                "Excellent" if user.total_score >= 90 else
-                "Good" if user.total_score >= 75 else
-                "Average" if user.total_score >= 50 else
-                "Poor"
-            )
-            writer.writerow([
-                user.username,
-                user.student_class.name if user.student_class else "N/A",
-                user.department.name if user.department else "N/A",
-                user.total_score,
-                classification
-            ])
-
-        return response
+        return exports.score_csv_artifact(
+            request, 'api',
+            ['Student', 'Class', 'Department', 'Score', 'Classification'],
+            exports.score_rows
+        )
 
 class ExportPDFViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAdminUser]
 
     @action(methods=['get'], detail=False, url_path="download")  # Thêm action để gọi API dễ dàng hơn
     def download_pdf(self, request):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="user_scores.pdf"'
-
-        pdf_canvas = canvas.Canvas(response, pagesize=letter)
-        width, height = letter
-
-        pdf_canvas.setFont("Helvetica-Bold", 16)
-        pdf_canvas.drawString(200, height - 50, "Danh sách Điểm số Sinh viên")
-
-        data = [["Tên sinh viên", "Lớp", "Khoa", "Điểm số", "Xếp loại"]]
-
-        users = User.objects.select_related('student_class', 'department')
-        for user in users:
-            classification = (
-                "Xuất sắc" if user.total_score >= 90 else
-                "Giỏi" if user.total_score >= 75 else
-                "Khá" if user.total_score >= 50 else
-                "Yếu"
-            )
-            data.append([
-                user.username,
-                user.student_class.name if user.student_class else "N/A",
-                user.department.name if user.department else "N/A",
-                str(user.total_score),
-                classification
-            ])
-
-        table = Table(data, colWidths=[100, 80, 100, 60, 80])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-
-        table.wrapOn(pdf_canvas, width, height)
-        table.drawOn(pdf_canvas, 50, height - 100 - (len(data) * 20))
-
-        pdf_canvas.save()
-        return response
+        report = exports.ScorePDFReport(
+            "Danh sách Điểm số Sinh viên",
+            ["Tên sinh viên", "Lớp", "Khoa", "Điểm số", "Xếp loại"],
+            [100, 80, 100, 60, 80]
+        )
+        return exports.score_pdf_artifact(
+            request, 'api', report,
+            lambda: exports.score_rows(labels=("Xuất sắc", "Giỏi", "Khá", "Yếu"))
+        )